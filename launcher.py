@@ -7,29 +7,102 @@ Parses common.zsh and provides fuzzy search functionality.
 import os
 import re
 import sys
-import pickle
+import json
+import mmap
+import time
+import socket
+import struct
+import hashlib
+import argparse
+import glob
+import heapq
+import math
+import tempfile
+import textwrap
+import threading
 import subprocess
 from pathlib import Path
-from typing import List
-from dataclasses import dataclass
+from collections import OrderedDict
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+# Start of the launcher's own clock for LAUNCHER_PROFILE
+_STARTED = time.perf_counter()
+
+
+class Profiler:
+    """Opt-in timing of launcher phases and keystrokes, saved as JSON lines.
+
+    Enabled by ``LAUNCHER_PROFILE=<path>`` or ``--profile [PATH]``. Events are
+    buffered in memory and appended to the file once, when the launcher
+    exits, so profiling doesn't add I/O while typing. When disabled every
+    method returns immediately.
+    """
+
+    DEFAULT_PATH = Path.home() / ".cache" / "launcher_profile.jsonl"
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.run_id = f"{int(time.time())}-{os.getpid()}"
+        self._events: List[dict] = []
+
+    @property
+    def enabled(self) -> bool:
+        """Whether events are being recorded."""
+        return self.path is not None
+
+    def since_start(self) -> float:
+        """Milliseconds since the launcher module started loading."""
+        return (time.perf_counter() - _STARTED) * 1000
+
+    def record(self, kind: str, **data):
+        """Record an event, e.g. ``record("phase", name="parse", ms=1.2)``."""
+        if self.path is None:
+            return
+        self._events.append(
+            {"run": self.run_id, "kind": kind, "at_ms": round(self.since_start(), 3), **data}
+        )
+
+    @contextmanager
+    def phase(self, name: str, **data):
+        """Time the wrapped block as a named phase."""
+        if self.path is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.record("phase", name=name, ms=round(elapsed, 3), **data)
+
+    def flush(self):
+        """Append the recorded events to the profile file."""
+        if self.path is None or not self._events:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for event in self._events:
+                    f.write(json.dumps(event) + "\n")
+        except OSError:
+            pass  # Profiling must never break the launcher
+        self._events = []
 
-try:
-    from textual.app import App, ComposeResult  # pyright: ignore[reportMissingImports]
-    from textual.containers import Container  # pyright: ignore[reportMissingImports]
-    from textual.widgets import Header, Footer, Input, Static, ListView, ListItem, Label # pyright: ignore[reportMissingImports] # pylint: disable=line-too-long
-    from textual.binding import Binding  # pyright: ignore[reportMissingImports]
-except ImportError:
-    print("Error: textual library not found. Install with: pip install textual")
-    sys.exit(1)
 
-try:
-    from fuzzywuzzy import fuzz, process # pyright: ignore[reportMissingImports]
-except ImportError:
-    print("Error: fuzzywuzzy library not found. Install with: pip install fuzzywuzzy")
-    sys.exit(1)
+_profile_env = os.environ.get("LAUNCHER_PROFILE")
+profiler = Profiler(Path(_profile_env).expanduser() if _profile_env else None)
 
 
-@dataclass
+# Commands and matches are slotted (no per-instance __dict__) where the
+# dataclass module supports it
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class Command:
     """Represents a command (function or alias) with its description."""
 
@@ -37,399 +110,2059 @@ class Command:
     description: str
     command_type: str  # 'function' or 'alias'
     raw_command: str  # The original command string for execution
+    source: str = ""  # Path of the zsh file that defines the command
+    # Byte offsets of a function's body in source (between the braces)
+    body_start: int = 0
+    body_end: int = 0
+
+
+@dataclass
+class FunctionDef:
+    """A function definition found by the lexer; offsets are byte offsets."""
+
+    name: str
+    comment: str  # Comment line directly above the definition
+    start: int  # Start of the definition (`name() {` / `function name {`)
+    body_start: int  # Just after the opening brace
+    body_end: int  # The matching closing brace
+
+
+@dataclass
+class AliasDef:
+    """An alias definition found by the lexer; offsets are byte offsets."""
+
+    name: str
+    value: str  # Alias value with one level of surrounding quotes removed
+    comment: str  # Inline comment after the value
+    start: int
+    end: int
+
+
+@dataclass
+class ScanResult:
+    """Everything ``scan_zsh`` finds in one pass over a file."""
+
+    functions: List[FunctionDef]
+    aliases: List[AliasDef]
+    comments: List[Tuple[int, str]]  # (byte offset, text without the '#')
+
+
+# Seconds to wait for the launcher server before parsing locally instead
+DAEMON_TIMEOUT = 0.5
+
+# Minimum scan_zsh throughput on configs of 1 MB or more, which
+# scripts/bench_launcher.py enforces. Measured at 10k and 100k items (1.3
+# and 13.5 MB): 5.1-5.4 MB/s on a single-core VM, 5.5-8.3 MB/s on a laptop.
+LEXER_TARGET_MBPS = 4.0
+
+# Lexer contexts. Code covers the top level, `{ }` groups, `( )` subshells and
+# `$( )` command substitutions; the others only need to find their own end.
+_CODE, _BRACE, _PAREN, _CMDSUB, _PARAM, _DQUOTE, _BACKTICK = range(7)
+
+# The leading lookahead lists every character a token can start with, so
+# ordinary text is rejected with one set lookup per byte. `#` and `alias`
+# only count at the start of a word, checked by the lookbehinds.
+_CODE_TOKENS = re.compile(
+    rb"(?=[a#<'$\\\"({`)}])(?:"
+    rb"(?P<alias>a(?<![^\s;&|(){}]a)lias\s+(?:-\w+\s+)*(?P<aname>[\w:.+@%,-]+)=)"
+    rb"|(?P<comment>#(?<![^\s;&|(){}]#)[^\n]*)"
+    rb"|(?P<heredoc><<(?<!<<<)(?!<)(?P<strip>-?)[ \t]*"
+    rb"(?:'(?P<hq1>[^'\n]*)'|\"(?P<hq2>[^\"\n]*)\"|\\?(?P<hd>[\w.-]+)))"
+    rb"|'[^']*'|\$'(?:[^'\\]|\\.)*'|\\."
+    # Strings and expansions without nesting are skipped whole
+    rb"|\"(?:[^\"\\$`]|\\.|\$(?![({])|\$\{[^{}$\"'`\\]*\})*\""
+    rb"|\$\{[^{}$\"'`\\]*\}|\$\([^()$\"'`\\#<{}]*\)"
+    rb"|(?P<open>\$\(|\$\{|[({\"`])"
+    rb"|(?P<close>[)}]))",
+    re.DOTALL,
+)
+# Matched backwards from a `{` to tell a function body from a plain group
+_FUNCTION_HEADER = re.compile(
+    rb"(?:^|(?<=[\s;&|(){}]))(?:function\s+(?P<fname>[\w:.+-]+)(?:\s*\(\s*\))?"
+    rb"|(?P<pname>[\w:.+-]+)\s*\(\s*\))\s*\Z"
+)
+_FUNCTION_HEADER_WINDOW = 256
+_DQUOTE_TOKENS = re.compile(rb"\\.|(?P<open>\$\(|\$\{|`)|(?P<close>\")", re.DOTALL)
+_PARAM_TOKENS = re.compile(
+    rb"\\.|'[^']*'|(?P<open>\$\(|\$\{|[\"`])|(?P<close>\})", re.DOTALL
+)
+_BACKTICK_TOKENS = re.compile(rb"\\.|(?P<close>`)", re.DOTALL)
+
+_TOKENS = {
+    _CODE: _CODE_TOKENS,
+    _BRACE: _CODE_TOKENS,
+    _PAREN: _CODE_TOKENS,
+    _CMDSUB: _CODE_TOKENS,
+    _PARAM: _PARAM_TOKENS,
+    _DQUOTE: _DQUOTE_TOKENS,
+    _BACKTICK: _BACKTICK_TOKENS,
+}
+_OPENERS = {
+    b"$(": _CMDSUB,
+    b"${": _PARAM,
+    b"(": _PAREN,
+    b"{": _BRACE,
+    b'"': _DQUOTE,
+    b"`": _BACKTICK,
+}
+_CLOSERS = {
+    _BRACE: b"}",
+    _PAREN: b")",
+    _CMDSUB: b")",
+    _PARAM: b"}",
+    _DQUOTE: b'"',
+    _BACKTICK: b"`",
+}
+
+_ALIAS_VALUE = re.compile(
+    rb"((?:'[^']*'|\"(?:[^\"\\]|\\.)*\"|\\.|[^\s;&|'\"])*)[ \t]*(?:#([^\n]*))?",
+    re.DOTALL,
+)
+_QUOTED_WORD = re.compile(rb"'[^']*'|\"(?:[^\"\\]|\\.)*\"", re.DOTALL)
+_BLANK = re.compile(rb"\s*")
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace")
+
+
+def _skip_heredocs(content: bytes, pos: int, heredocs: List[Tuple[bytes, bool]]) -> int:
+    """Skip heredoc bodies starting at ``pos``; return the offset after them."""
+    for delimiter, strip_tabs in heredocs:
+        end_line = re.compile(
+            rb"^" + (rb"\t*" if strip_tabs else b"") + re.escape(delimiter) + rb"$",
+            re.MULTILINE,
+        )
+        match = end_line.search(content, pos)
+        if match is None:
+            return len(content)
+        pos = match.end() + 1
+    return pos
+
+
+def _function_header(content: bytes, brace: int) -> Optional[re.Match]:
+    """Match a function header ending at the `{` at offset ``brace``, if any."""
+    # Cheap check first: a header ends in `)` or in the name after `function`
+    last = brace - 1
+    while last >= 0 and content[last] in b" \t\n":
+        last -= 1
+    if last < 0:
+        return None
+    # The name is on the same line as the `)` or the last word
+    window_start = content.rfind(b"\n", max(0, last - _FUNCTION_HEADER_WINDOW), last) + 1
+    if content[last] != 0x29 and content.find(b"function", window_start, last) < 0:
+        return None  # 0x29 is `)`
+    return _FUNCTION_HEADER.search(content, window_start, brace)
+
+
+def scan_zsh(content: bytes) -> ScanResult:
+    """Tokenize a zsh file in a single linear pass.
+
+    Tracks quoting, `${...}`/`$(...)` expansions, backticks, heredocs and
+    comments, so braces inside any of them don't affect function bodies.
+    The regex for the current context skips straight to the next character
+    that matters, which keeps throughput above ``LEXER_TARGET_MBPS``.
+    """
+    functions: List[FunctionDef] = []
+    aliases: List[AliasDef] = []
+    comments: List[Tuple[int, str]] = []
+
+    # Each frame is (context, index of the function it opens or -1)
+    stack: List[Tuple[int, int]] = [(_CODE, -1)]
+    heredocs: List[Tuple[bytes, bool]] = []
+    heredoc_line_end = -1
+    # (text, end offset) of the last comment that started its own line
+    line_comment: Optional[Tuple[str, int]] = None
+
+    context = _CODE
+    search = _CODE_TOKENS.search
+    pos = 0
+    size = len(content)
+    while pos < size:
+        match = search(content, pos)
+
+        if heredocs and (match is None or match.start() > heredoc_line_end):
+            pos = _skip_heredocs(content, heredoc_line_end + 1, heredocs)
+            heredocs = []
+            continue
+        if match is None:
+            break
+        pos = match.end()
+        kind = match.lastgroup
+
+        if kind is None:
+            continue  # quoted string, escape or simple expansion
+        if kind == "open":
+            opener = match.group("open")
+            header = None
+            if opener == b"{":
+                header = _function_header(content, match.start())
+            if header is None:
+                context = _OPENERS[opener]
+                search = _TOKENS[context].search
+                stack.append((context, -1))
+                continue
+            start = header.start()
+            comment = ""
+            if line_comment is not None:
+                text, comment_end = line_comment
+                if _BLANK.match(content, comment_end, start).end() == start:
+                    comment = text
+            functions.append(
+                FunctionDef(
+                    name=_decode(header.group("fname") or header.group("pname")),
+                    comment=comment,
+                    start=start,
+                    body_start=pos,
+                    body_end=-1,
+                )
+            )
+            context = _BRACE
+            search = _CODE_TOKENS.search
+            stack.append((context, len(functions) - 1))
+        elif kind == "close":
+            if _CLOSERS.get(context) == match.group("close"):
+                _, function_index = stack.pop()
+                if function_index >= 0:
+                    functions[function_index].body_end = match.start()
+                context = stack[-1][0]
+                search = _TOKENS[context].search
+            # Otherwise a stray `)` (e.g. a case pattern) - ignore it
+        elif kind == "comment":
+            start = match.start()
+            text = _decode(match.group("comment")[1:]).strip()
+            comments.append((start, text))
+            line_start = content.rfind(b"\n", 0, start) + 1
+            if _BLANK.match(content, line_start, start).end() == start:
+                line_comment = (text, pos)
+        elif kind == "alias":
+            value_match = _ALIAS_VALUE.match(content, pos)
+            value = value_match.group(1)
+            if _QUOTED_WORD.fullmatch(value):
+                value = value[1:-1]
+            comment = ""
+            if value_match.group(2) is not None:
+                comment = _decode(value_match.group(2)).strip()
+                comments.append((value_match.start(2) - 1, comment))
+            aliases.append(
+                AliasDef(
+                    name=_decode(match.group("aname")),
+                    value=_decode(value),
+                    comment=comment,
+                    start=match.start(),
+                    end=value_match.end(),
+                )
+            )
+            pos = value_match.end()
+        elif kind == "heredoc":
+            delimiter = next(
+                match.group(name)
+                for name in ("hq1", "hq2", "hd")
+                if match.group(name) is not None
+            )
+            if not heredocs:
+                heredoc_line_end = content.find(b"\n", pos)
+                if heredoc_line_end < 0:
+                    heredoc_line_end = size
+            heredocs.append((delimiter, bool(match.group("strip"))))
+
+    return ScanResult(
+        functions=[f for f in functions if f.body_end >= 0],
+        aliases=aliases,
+        comments=comments,
+    )
+
+
+# On-disk command index. Little-endian, fixed-size records pointing into one
+# UTF-8 string table, so it can be read straight out of an mmap:
+#
+#   header | source records | command records | string table
+#
+# Bump INDEX_VERSION whenever the layout or the meaning of a field changes;
+# an index with any other version is ignored and rebuilt.
+INDEX_MAGIC = b"LNCHIDX\0"
+INDEX_VERSION = 5
+# magic, version, source count, command count, string table offset and size
+_INDEX_HEADER = struct.Struct("<8sHxxIIII")
+# path, size, mtime_ns, sha1, literal sourced files, launcher-hidden names and
+# DOTFILES_OPTS loop rules (each '\n'-joined)
+_SOURCE_RECORD = struct.Struct("<IIQq20sIIIIII")
+# name, description, raw_command, body start and end, command_type, source index
+_COMMAND_RECORD = struct.Struct("<IIIIIIIIB3xI")
+_COMMAND_TYPES = ("function", "alias")
+
+
+class _StringTable:
+    """Collects strings for the index; returns (offset, length) references."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, text: str) -> Tuple[int, int]:
+        ref = self._offsets.get(text)
+        if ref is None:
+            raw = text.encode("utf-8")
+            ref = (len(self.data), len(raw))
+            self.data += raw
+            self._offsets[text] = ref
+        return ref
+
+
+def save_index(path: Path, entries: Dict[str, dict]):
+    """Atomically write per-file cache entries to ``path``.
+
+    The index is written to a temp file in the same directory and renamed
+    over the old one, so a reader never sees a partial file.
+    """
+    strings = _StringTable()
+    sources = bytearray()
+    commands = bytearray()
+    for source_index, (source, entry) in enumerate(entries.items()):
+        sources += _SOURCE_RECORD.pack(
+            *strings.add(source),
+            entry["size"],
+            entry["mtime"],
+            bytes.fromhex(entry["hash"]),
+            *strings.add("\n".join(entry["sources"])),
+            *strings.add("\n".join(entry["hidden"])),
+            *strings.add("\n".join(entry["opts_loop"])),
+        )
+        for cmd in entry["commands"]:
+            commands += _COMMAND_RECORD.pack(
+                *strings.add(cmd.name),
+                *strings.add(cmd.description),
+                *strings.add(cmd.raw_command),
+                cmd.body_start,
+                cmd.body_end,
+                _COMMAND_TYPES.index(cmd.command_type),
+                source_index,
+            )
+
+    strings_offset = _INDEX_HEADER.size + len(sources) + len(commands)
+    header = _INDEX_HEADER.pack(
+        INDEX_MAGIC,
+        INDEX_VERSION,
+        len(sources) // _SOURCE_RECORD.size,
+        len(commands) // _COMMAND_RECORD.size,
+        strings_offset,
+        len(strings.data),
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(sources)
+            f.write(commands)
+            f.write(strings.data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_index(path: Path) -> Dict[str, dict]:
+    """Read per-file cache entries from an index written by ``save_index``.
+
+    Raises ValueError if the file isn't an index of the current version.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if len(mm) < _INDEX_HEADER.size:
+            raise ValueError("index is truncated")
+        magic, version, n_sources, n_commands, strings_offset, strings_size = (
+            _INDEX_HEADER.unpack_from(mm)
+        )
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"unsupported index (version {version})")
+        if strings_offset + strings_size != len(mm) or strings_offset != (
+            _INDEX_HEADER.size
+            + n_sources * _SOURCE_RECORD.size
+            + n_commands * _COMMAND_RECORD.size
+        ):
+            raise ValueError("index is truncated")
+
+        def string(offset: int, length: int) -> str:
+            start = strings_offset + offset
+            return mm[start : start + length].decode("utf-8")
+
+        entries: Dict[str, dict] = {}
+        source_names: List[str] = []
+        record_offset = _INDEX_HEADER.size
+        for _ in range(n_sources):
+            (
+                path_off, path_len, size, mtime, digest,
+                src_off, src_len, hidden_off, hidden_len, opts_off, opts_len,
+            ) = _SOURCE_RECORD.unpack_from(mm, record_offset)
+            record_offset += _SOURCE_RECORD.size
+            name = string(path_off, path_len)
+            sourced = string(src_off, src_len)
+            hidden = string(hidden_off, hidden_len)
+            opts_loop = string(opts_off, opts_len)
+            entries[name] = {
+                "size": size,
+                "mtime": mtime,
+                "hash": digest.hex(),
+                "commands": [],
+                "sources": sourced.split("\n") if sourced else [],
+                "hidden": hidden.split("\n") if hidden else [],
+                "opts_loop": opts_loop.split("\n") if opts_loop else [],
+            }
+            source_names.append(name)
+
+        for fields in _COMMAND_RECORD.iter_unpack(
+            mm[record_offset : record_offset + n_commands * _COMMAND_RECORD.size]
+        ):
+            source = source_names[fields[9]]
+            entries[source]["commands"].append(
+                Command(
+                    name=sys.intern(string(fields[0], fields[1])),
+                    description=string(fields[2], fields[3]),
+                    command_type=_COMMAND_TYPES[fields[8]],
+                    raw_command=string(fields[4], fields[5]),
+                    source=source,
+                    body_start=fields[6],
+                    body_end=fields[7],
+                )
+            )
+    return entries
+
+
+# The loop at the bottom of common.zsh that sources a file per DOTFILES_OPTS
+# entry, and the lines of it that _opts_loop_rules reads
+_OPTS_LOOP = re.compile(
+    r'^for (\w+) in "\$\{DOTFILES_OPTS\[@\]\}"; do$(.*?)^done\b', re.MULTILINE | re.DOTALL
+)
+_OPTS_CASE = re.compile(r'(?:if|elif) \[\[ "?\$\{?(\w+)\}?"? == "?([^"\s]+?)"? \]\]; then')
+_OPTS_ASSIGN = re.compile(r'(\w+)="([^"]*)"')
+
+
+def _opts_loop_rules(content: str) -> List[str]:
+    """The branches of a file's DOTFILES_OPTS loop, as `opt<TAB>file` rules.
+
+    The loop is read as common.zsh writes it (see the comment above it
+    there): an if/elif chain on the loop variable, each branch assigning
+    the file to source or running `continue`, with an else for every
+    other option, then `source "$file"`. opt is `*` for the else branch,
+    file is empty for `continue`, and the loop variable in a file reads
+    `$opt`. Empty if there is no such loop, or it sources something else.
+    """
+    loop = _OPTS_LOOP.search(content)
+    if loop is None:
+        return []
+    variable, body = loop.groups()
+    rules: List[str] = []
+    assigned: Set[str] = set()
+    case: Optional[str] = None
+    for line in body.splitlines():
+        line = line.strip()
+        match = _OPTS_CASE.fullmatch(line)
+        assignment = _OPTS_ASSIGN.fullmatch(line)
+        if match is not None and match.group(1) == variable:
+            case = match.group(2)
+        elif line == "else" and case is not None:
+            case = "*"
+        elif line == "fi":
+            case = None
+        elif case is not None and line == "continue":
+            rules.append(f"{case}\t")
+        elif case is not None and assignment is not None:
+            name, target = assignment.groups()
+            assigned.add(name)
+            target = target.replace(f"${{{variable}}}", "$opt").replace(f"${variable}", "$opt")
+            rules.append(f"{case}\t{target}")
+    sourced = re.search(
+        r'^\s*(?:source|\.) "?\$\{?(\w+)\}?"?\s*$', body, re.MULTILINE
+    )
+    if sourced is None or sourced.group(1) not in assigned:
+        return []
+    return rules
+
+
+# Descriptions that keep a function or alias out of the launcher
+_HIDDEN_DESCRIPTIONS = ("launcher-hidden", "launcher-hide")
 
 
 class ZshParser:
-    """Parses zsh files to extract functions, aliases, and their descriptions."""
+    """Parses zsh files to extract functions, aliases, and their descriptions.
+
+    Starts at the given file and follows every file it sources, including the
+    per-option files pulled in by the ``DOTFILES_OPTS`` loop at the bottom of
+    common.zsh. Each file has its own cache entry, so only edited files are
+    re-parsed on launch.
+    """
 
-    def __init__(self, zsh_file_path: str):
+    def __init__(self, zsh_file_path: str, dotfiles_opts: Optional[List[str]] = None):
         self.zsh_file_path = Path(zsh_file_path)
+        if dotfiles_opts is None:
+            # zsh can't export arrays, so `l` passes DOTFILES_OPTS space-joined
+            dotfiles_opts = os.environ.get("DOTFILES_OPTS", "").split()
+        self.dotfiles_opts = dotfiles_opts
         self.commands: List[Command] = []
-        self.cache_file = Path.home() / ".cache" / "launcher_cache.pkl"
+        # Names defined but kept out of the launcher (`l`, launcher-hidden)
+        self.hidden: Set[str] = set()
+        self.cache_file = Path.home() / ".cache" / "launcher_index.bin"
+        self._cache: Dict[str, dict] = {}
 
     def parse(self) -> List[Command]:
-        """Parse the zsh file and return a list of commands."""
+        """Parse the zsh file and every file it sources; return the commands."""
         if not self.zsh_file_path.exists():
             raise FileNotFoundError(f"Zsh file not found: {self.zsh_file_path}")
 
-        if self._load_cache():
-            return self.commands
+        if not self._cache:
+            self._load_cache()
 
-        with open(self.zsh_file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        entries: Dict[str, dict] = {}
+        pending = [self.zsh_file_path]
+        changed = False
+        while pending:
+            path = pending.pop(0)
+            key = str(path)
+            if key in entries:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
 
-        self._parse_functions(content)
-        self._parse_aliases(content)
+            entry = self._cache.get(key)
+            if not self._entry_matches(entry, stat):
+                entry = self._refresh_entry(path, stat, entry)
+                changed = True
+            entries[key] = entry
 
-        self.commands.sort(key=lambda x: x.name)
+            pending.extend(Path(p) for p in entry["sources"])
+            if entry["opts_loop"]:
+                pending.extend(self._dotfiles_opt_files(entry["opts_loop"]))
 
-        # self._save_cache()   # disable saving too while debugging
+        if not changed and set(entries) == set(self._cache) and self.commands:
+            return self.commands  # nothing changed since the last parse()
 
-        return self.commands
+        if changed or set(entries) != set(self._cache):
+            self._cache = entries
+            self._save_cache()
 
-    def _load_cache(self) -> bool:
-        """Load commands from cache if valid."""
-        try:
-            if not self.cache_file.exists():
-                return False
+        # Later files override earlier definitions, as they would in zsh
+        merged: Dict[str, Command] = {}
+        for entry in entries.values():
+            for cmd in entry["commands"]:
+                merged[cmd.name] = cmd
+        self.commands = sorted(merged.values(), key=lambda x: x.name)
+        self.hidden = {name for entry in entries.values() for name in entry["hidden"]}
 
-            # Check if cache is newer than zsh file
-            cache_time = self.cache_file.stat().st_mtime
-            zsh_time = self.zsh_file_path.stat().st_mtime
+        return self.commands
 
-            if cache_time < zsh_time:
-                return False
+    def sources(self) -> List[str]:
+        """Every file the last parse() read."""
+        return list(self._cache)
+
+    @staticmethod
+    def _entry_matches(entry: Optional[dict], stat: os.stat_result) -> bool:
+        """Check a cache entry against a file's size and mtime."""
+        return (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime_ns
+        )
+
+    def _refresh_entry(self, path: Path, stat: os.stat_result, entry: Optional[dict]):
+        """Re-read a file whose stat changed; re-parse only if its content did."""
+        return self._read_entry(path, stat, entry)[0]
+
+    def _read_entry(
+        self, path: Path, stat: os.stat_result, entry: Optional[dict]
+    ) -> Tuple[dict, Optional[ScanResult]]:
+        """_refresh_entry, plus the lexer's scan if the file was re-parsed."""
+        data = path.read_bytes()
+        digest = hashlib.sha1(data).hexdigest()
+        if entry is not None and entry["hash"] == digest:
+            # Touched but unchanged - keep the parsed commands
+            return dict(entry, size=stat.st_size, mtime=stat.st_mtime_ns), None
+
+        content = data.decode("utf-8", errors="replace")
+        commands: List[Command] = []
+        with profiler.phase("parse_file", path=str(path), bytes=len(data)):
+            scan = scan_zsh(data)
+            self._parse_functions(scan, str(path), commands)
+            self._parse_aliases(scan, str(path), commands)
+        hidden = [
+            definition.name
+            for definition in [*scan.functions, *scan.aliases]
+            if definition.name == "l" or definition.comment in _HIDDEN_DESCRIPTIONS
+        ]
+
+        return {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": digest,
+            "commands": commands,
+            "sources": self._sourced_files(content, path),
+            "hidden": hidden,
+            "opts_loop": _opts_loop_rules(content),
+        }, scan
+
+    @staticmethod
+    def _sourced_files(content: str, path: Path) -> List[str]:
+        """Find files sourced by literal path (`source ~/x.zsh` or `. $HOME/x`)."""
+        sources = []
+        for match in re.finditer(
+            r"^\s*(?:source|\.)\s+([^\s;&|]+)", content, re.MULTILINE
+        ):
+            target = match.group(1).strip("'\"")
+            target = os.path.expandvars(os.path.expanduser(target))
+            if "$" in target:
+                continue  # depends on runtime state; see _opts_loop_rules
+            target_path = Path(target)
+            if not target_path.is_absolute():
+                target_path = path.parent / target_path
+            sources.append(str(target_path))
+        return sources
+
+    def _dotfiles_opt_files(self, rules: List[str]) -> List[Path]:
+        """The files a DOTFILES_OPTS loop (see _opts_loop_rules) sources
+        for this parser's options."""
+        files = []
+        for opt in self.dotfiles_opts:
+            for rule in rules:
+                case, _, target = rule.partition("\t")
+                if case in (opt, "*"):
+                    if target:  # else the branch continues without sourcing
+                        target = target.replace("$opt", opt)
+                        files.append(Path(os.path.expandvars(os.path.expanduser(target))))
+                    break
+        return files
 
-            with open(self.cache_file, "rb") as f:
-                self.commands = pickle.load(f)
+    def _load_cache(self) -> bool:
+        """Load the per-file cache entries from the command index, if valid."""
+        try:
+            self._cache = load_index(self.cache_file)
             return True
-        except Exception:  # pylint: disable=broad-exception-caught
-            return False
+        except (OSError, ValueError, struct.error, IndexError):
+            return False  # missing, truncated or from another version
 
     def _save_cache(self):
-        """Save commands to cache."""
+        """Save the per-file cache entries to the command index."""
         try:
-            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.cache_file, "wb") as f:
-                pickle.dump(self.commands, f)
+            save_index(self.cache_file, self._cache)
+            # Drop the pickle cache used before the command index
+            (self.cache_file.parent / "launcher_cache.pkl").unlink(missing_ok=True)
         except Exception:  # pylint: disable=broad-exception-caught
             pass  # Ignore cache errors
 
-    def _parse_functions(self, content: str):
-        """Parse function definitions and their comments."""
-        # Pattern to match function definitions with optional comments
-        # Note: [\w-]+ allows hyphens in function names
-        function_pattern = r"(?:^#\s*([^\n]+)\s*$)?\s*(?:function\s+)?([\w-]+)\s*\(\s*\)\s*\{"
-
-        for match in re.finditer(function_pattern, content, re.MULTILINE):
-            comment = match.group(1) or ""
-            func_name = match.group(2)
-
+    def _parse_functions(self, scan: ScanResult, source: str, commands: List[Command]):
+        """Turn the lexer's function definitions into commands."""
+        for func in scan.functions:
             # Skip the launcher function itself
-            if func_name == "l":
+            if func.name == "l":
                 continue
 
-            # Extract the function body
-            start_pos = match.end()
-            brace_count = 1
-            end_pos = start_pos
-
-            while end_pos < len(content) and brace_count > 0:
-                if content[end_pos] == "{":
-                    brace_count += 1
-                elif content[end_pos] == "}":
-                    brace_count -= 1
-                end_pos += 1
-
-            if brace_count == 0:
-                description = comment.strip()
+            description = func.comment
 
-                # Skip functions with launcher-hidden or launcher-hide description
-                if description in ["launcher-hidden", "launcher-hide"]:
-                    continue
+            # Skip functions with launcher-hidden or launcher-hide description
+            if description in _HIDDEN_DESCRIPTIONS:
+                continue
 
-                self.commands.append(
-                    Command(
-                        name=func_name,
-                        description=description,
-                        command_type="function",
-                        raw_command=func_name,
-                    )
+            commands.append(
+                Command(
+                    name=sys.intern(func.name),
+                    description=description,
+                    command_type="function",
+                    raw_command=func.name,
+                    source=source,
+                    body_start=func.body_start,
+                    body_end=func.body_end,
                 )
+            )
 
-    def _parse_aliases(self, content: str):
-        lines = content.splitlines()
-        debug_path = Path.home() / "test.md"
-        with open(debug_path, "w", encoding="utf-8") as dbg:
-            dbg.write("# Alias Debug Output\n\n")
-
-            for line in lines:
-                if not line.strip().startswith("alias "):
-                    continue
-                if "=" not in line:
-                    continue
-
-                dbg.write(f"RAW: {line}\n")
-
-                alias_def, alias_rest = line.split("=", 1)
-                alias_name = alias_def.replace("alias", "").strip()
-                if alias_name == "l":
-                    continue
-
-                # Default values
-                comment_inline = ""
-                alias_value = alias_rest.strip()
-
-                # Split off inline comment if present
-                if "#" in alias_rest:
-                    alias_value, comment_inline = alias_rest.split("#", 1)
-                    alias_value = alias_value.strip()
-                    comment_inline = comment_inline.strip()
-
-                # Strip quotes around alias value
-                if alias_value.startswith(("'", '"')) and alias_value.endswith(
-                    ("'", '"')
-                ):
-                    alias_value = alias_value[1:-1]
+    def _parse_aliases(self, scan: ScanResult, source: str, commands: List[Command]):
+        """Turn the lexer's alias definitions into commands."""
+        for alias in scan.aliases:
+            if alias.name == "l":
+                continue
 
-                description = comment_inline  # only inline
+            description = alias.comment  # only inline
 
-                # Skip aliases with launcher-hidden or launcher-hide description
-                if description in ["launcher-hidden", "launcher-hide"]:
-                    continue
+            # Skip aliases with launcher-hidden or launcher-hide description
+            if description in _HIDDEN_DESCRIPTIONS:
+                continue
 
-                dbg.write(f"  alias_name: {alias_name}\n")
-                dbg.write(f"  alias_value: {alias_value}\n")
-                dbg.write(f"  comment_inline: {comment_inline}\n")
-                dbg.write(f"  description: {description}\n\n")
-
-                self.commands.append(
-                    Command(
-                        name=alias_name,
-                        description=description,
-                        command_type="alias",
-                        raw_command=alias_value,
-                    )
+            commands.append(
+                Command(
+                    name=sys.intern(alias.name),
+                    description=description,
+                    command_type="alias",
+                    raw_command=alias.value,
+                    source=source,
                 )
+            )
 
 
-class CommandItem(ListItem):
-    """A list item representing a command."""
+def merge_commands(
+    commands: List[Command], extra: List[Command], hidden: Set[str]
+) -> List[Command]:
+    """commands plus those in extra they don't define or hide, by name.
 
-    def __init__(self, command: Command):
-        self.command = command
-        super().__init__()
+    Returns commands itself when nothing is added.
+    """
+    known = hidden | {cmd.name for cmd in commands}
+    added = [cmd for cmd in extra if cmd.name not in known]
+    return sorted(commands + added, key=lambda x: x.name) if added else commands
 
-    def compose(self):
-        """Compose the command item widget."""
-        yield Label(
-            f"{self.command.name} - {self.command.description or 'No description'}"
-        )
 
+# An extensionless file is only read as zsh when its name could be a
+# function's, and isn't a build file or (all caps) a document
+_AUTOLOAD_NAME = re.compile(r"[A-Za-z_][\w.:+-]*\Z")
+_NOT_AUTOLOAD = frozenset(
+    "Brewfile Dockerfile Gemfile Jenkinsfile Justfile Makefile makefile Procfile "
+    "Rakefile Vagrantfile".split()
+)
 
-class LauncherApp(App):
-    """Interactive TUI launcher for commands using Textual."""
 
-    BINDINGS = [
-        Binding("q", "quit", "Quit"),
-        Binding("escape", "quit", "Quit"),
-        Binding("ctrl+j", "focus_list", "Focus List"),
-        Binding("ctrl+k", "focus_search", "Focus Search"),
-    ]
+def _autoload_name(name: str) -> bool:
+    """Whether an extensionless file called name looks like an autoload file."""
+    return (
+        _AUTOLOAD_NAME.match(name) is not None
+        and not name.isupper()  # LICENSE, README, TODO
+        and name not in _NOT_AUTOLOAD
+    )
 
-    def __init__(self, commands: List[Command], zsh_file_path: str):
-        super().__init__()
-        self.commands = commands
-        self.zsh_file_path = zsh_file_path
-        self.filtered_commands = commands.copy()
-
-    def compose(self) -> ComposeResult:
-        """Create child widgets for the app."""
-        yield Header()
-        yield Container(
-            Input(placeholder="Search commands...", id="search"),
-            ListView(id="command_list"),
-            id="main",
+
+def _ingest_file(path: str, entry: Optional[dict]) -> Optional[dict]:
+    """Parse one file for BulkIngest; runs in a worker process."""
+    file_path = Path(path)
+    try:
+        entry, scan = ZshParser(path)._read_entry(  # pylint: disable=protected-access
+            file_path, file_path.stat(), entry
         )
-        yield Footer()
-
-    def on_mount(self) -> None:
-        """Called when app starts."""
-        self._populate_list()
-        # Focus the search input so user can immediately type
-        search_input = self.query_one("#search", Input)
-        search_input.focus()
-
-    def on_input_changed(self, event: Input.Changed) -> None:
-        """Called when the search input changes."""
-        if event.input.id == "search":
-            self._filter_commands(event.value)
-
-    def on_key(self, event) -> None:
-        """Handle global key events."""
-        # Handle arrow keys globally
-        if event.key == "up":
-            self.action_move_up()
-        elif event.key == "down":
-            self.action_move_down()
-        elif event.key == "enter":
-            # If we're in the search input, execute the first command
-            if isinstance(self.focused, Input):
-                self.action_execute_first()
+    except OSError:
+        return None
+    name = file_path.name
+    if (
+        not file_path.suffix
+        and not name.startswith("_")
+        and _autoload_name(name)
+        and all(cmd.name != name for cmd in entry["commands"])
+        and name not in entry["hidden"]
+    ):
+        # An autoload file: its contents are the body of a function named
+        # after it. Describe it by its first comment that isn't a tag line
+        description = ""
+        if scan is None:
+            scan = scan_zsh(file_path.read_bytes())  # unchanged, but not ingested before
+        for _, text in scan.comments:
+            text = text.strip()
+            if text and not text.startswith(("!", "compdef", "autoload", "vim:", "-*-")):
+                description = text
+                break
+        entry["commands"] = entry["commands"] + [
+            Command(name, description, "function", name, source=path)
+        ]
+    return entry
+
+
+class BulkIngest:
+    """Commands from whole directories and globs of zsh files, e.g. fpath
+    autoload directories or a plugin framework's tree.
+
+    Directories are walked for ``.zsh``/``.sh`` files and extensionless
+    autoload files (named like a function, so not LICENSE or Makefile);
+    globs are used as given. Files are parsed one task per
+    file across a process pool, so indexing scales with the cores, and
+    kept in their own index (``~/.cache/launcher_ingest.bin``) so a
+    relaunch only re-parses files whose stat changed. A directory is only
+    listed again once its mtime changes. When several files define a
+    name, the first wins, as it would for autoload along fpath; each
+    command's ``source`` records the file it came from.
+    """
+
+    SUFFIXES = ("", ".zsh", ".sh")
+    # Below this many files to parse, a pool costs more than it saves
+    POOL_MIN_FILES = 32
+
+    def __init__(self, patterns: List[str], workers: Optional[int] = None):
+        self.patterns = patterns
+        self.workers = workers or os.cpu_count() or 1
+        self.commands: List[Command] = []
+        self.hidden: Set[str] = set()
+        self.cache_file = Path.home() / ".cache" / "launcher_ingest.bin"
+        self._cache: Dict[str, dict] = {}
+        # directory -> (mtime_ns, its files to ingest, its subdirectories)
+        self._listings: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        self._checked_at = 0.0
+        self._merged_base: Optional[List[Command]] = None
+        self._merged_from: Optional[List[Command]] = None
+        self._merged: List[Command] = []
+
+    def files(self) -> List[str]:
+        """Every file the patterns name, in pattern order, without repeats."""
+        seen: Dict[str, None] = {}
+        for pattern in self.patterns:
+            pattern = os.path.expandvars(os.path.expanduser(pattern))
+            matches = [pattern]
+            if glob.has_magic(pattern):
+                matches = sorted(glob.glob(pattern, recursive=True))
+            for match in matches:
+                if os.path.isdir(match):
+                    for path in self._walk(match):
+                        seen.setdefault(path, None)
+                elif os.path.isfile(match):
+                    seen.setdefault(os.path.abspath(match), None)
+        return list(seen)
+
+    def _walk(self, directory: str) -> List[str]:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+        listing = self._listings.get(directory)
+        if listing is None or listing[0] != mtime:
+            files, subdirs = [], []
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError:
+                return []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    suffix = os.path.splitext(entry.name)[1]
+                    if suffix in self.SUFFIXES and (suffix or _autoload_name(entry.name)):
+                        files.append(os.path.abspath(entry.path))
+            listing = self._listings[directory] = (mtime, files, subdirs)
+        files = list(listing[1])
+        for subdir in listing[2]:
+            files.extend(self._walk(subdir))
+        return files
+
+    def parse(self, max_age: float = 0.0) -> List[Command]:
+        """Parse every file that changed since the last run; return the commands.
+
+        With max_age, the last result stands if it was checked less than
+        that many seconds ago.
+        """
+        if self.commands and time.monotonic() - self._checked_at < max_age:
+            return self.commands
+        self._checked_at = time.monotonic()
+        if not self._cache:
+            try:
+                self._cache = load_index(self.cache_file)
+            except (OSError, ValueError, struct.error, IndexError):
+                pass
+
+        entries: Dict[str, Optional[dict]] = {}
+        stale: List[str] = []
+        for path in self.files():
+            entry = self._cache.get(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if ZshParser._entry_matches(entry, stat):  # pylint: disable=protected-access
+                entries[path] = entry
             else:
-                # Otherwise execute the currently selected item
-                self.action_select_item()
-
-    def on_list_view_selected(self, event: ListView.Selected) -> None:
-        """Called when a list item is selected.
+                entries[path] = None
+                stale.append(path)
 
-        Commands are executed only when Enter is pressed, not on selection.
-        """
+        if not stale and set(entries) == set(self._cache) and self.commands:
+            return self.commands
 
-    def action_move_up(self) -> None:
-        """Move selection up."""
-        list_view = self.query_one("#command_list", ListView)
-        current_index = list_view.index or 0
-        if current_index > 0:
-            list_view.index = current_index - 1
-
-    def action_move_down(self) -> None:
-        """Move selection down."""
-        list_view = self.query_one("#command_list", ListView)
-        current_index = list_view.index or 0
-        max_index = len(list_view.children) - 1
-        if current_index < max_index:
-            list_view.index = current_index + 1
-
-    def action_select_item(self) -> None:
-        """Select the current item."""
-        list_view = self.query_one("#command_list", ListView)
-        current_index = list_view.index or 0
-        if current_index < len(list_view.children):
-            selected_item = list_view.children[current_index]
-            if hasattr(selected_item, "command"):
-                self._execute_command(selected_item.command)
-
-    def action_focus_list(self) -> None:
-        """Focus the list view."""
-        list_view = self.query_one("#command_list", ListView)
-        list_view.focus()
-
-    def action_focus_search(self) -> None:
-        """Focus the search input."""
-        search_input = self.query_one("#search", Input)
-        search_input.focus()
-
-    def action_execute_first(self) -> None:
-        """Execute the first command in the filtered list."""
-        if self.filtered_commands:
-            first_command = self.filtered_commands[0]
-            self._execute_command(first_command)
-
-    def _populate_list(self):
-        """Populate the list with commands."""
-        list_view = self.query_one("#command_list", ListView)
-        list_view.clear()
-
-        for cmd in self.filtered_commands:  # Show all commands
-            item = CommandItem(cmd)
-            list_view.append(item)
-
-        # Don't auto-select the first item to prevent automatic execution
-        list_view.index = None
-
-    def _filter_commands(self, query: str):
-        """Filter commands based on query."""
-        if not query:
-            self.filtered_commands = self.commands.copy()
-        else:
-            # Use optimized fuzzy matching
-            query_lower = query.lower()
-
-            # First try exact substring matches for speed
-            exact_matches = []
-            for cmd in self.commands:
-                if (
-                    query_lower in cmd.name.lower()
-                    or query_lower in cmd.description.lower()
-                ):
-                    exact_matches.append(cmd)
-
-            if exact_matches:
-                self.filtered_commands = exact_matches
+        with profiler.phase("ingest", files=len(entries), parsed=len(stale)):
+            previous = [self._cache.get(path) for path in stale]
+            if len(stale) < self.POOL_MIN_FILES or self.workers == 1:
+                parsed = list(map(_ingest_file, stale, previous))
             else:
-                # Fall back to fuzzy matching for partial matches
-                # Create a list of command names for fuzzy matching
-                command_names = [cmd.name for cmd in self.commands]
-                matches = process.extract(
-                    query, command_names, scorer=fuzz.ratio, limit=10
-                )
+                # pylint: disable=import-outside-toplevel
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    # Batch the IPC, but keep enough chunks to balance the load
+                    chunksize = max(1, len(stale) // (self.workers * 8))
+                    parsed = list(pool.map(_ingest_file, stale, previous, chunksize=chunksize))
+            for path, entry in zip(stale, parsed):
+                entries[path] = entry
+        self._cache = {path: entry for path, entry in entries.items() if entry is not None}
+        try:
+            save_index(self.cache_file, self._cache)
+        except OSError:
+            pass  # Ignore cache errors
 
-                # Extract command names from matches
-                matched_names = [match[0] for match in matches if match[1] > 30]
+        first: Dict[str, Command] = {}
+        for entry in self._cache.values():
+            for cmd in entry["commands"]:
+                first.setdefault(cmd.name, cmd)
+        self.commands = sorted(first.values(), key=lambda x: x.name)
+        self.hidden = {name for entry in self._cache.values() for name in entry["hidden"]}
+        return self.commands
 
-                self.filtered_commands = [
-                    cmd for cmd in self.commands if cmd.name in matched_names
-                ]
+    def sources(self) -> List[str]:
+        """Every file ingested on the last parse."""
+        return list(self._cache)
+
+    def merge(
+        self, commands: List[Command], hidden: Set[str], max_age: float = 0.0
+    ) -> List[Command]:
+        """commands plus ingested ones they don't define or hide; the same
+        list as last time while neither side changed. max_age is parse()'s."""
+        ingested = self.parse(max_age)
+        if commands is not self._merged_base or ingested is not self._merged_from:
+            self._merged = merge_commands(commands, ingested, hidden | self.hidden)
+            self._merged_base, self._merged_from = commands, ingested
+        return self._merged
+
+
+# Sources the config in `zsh -f` (argument 1) and prints the live alias and
+# function tables as NUL-separated (type, name, value) triples; a function's
+# value is the file it came from, when zsh knows it
+_HARVEST_SCRIPT = r"""
+zmodload zsh/parameter
+DOTFILES_OPTS=(${=DOTFILES_OPTS})
+source "$1" </dev/null >/dev/null 2>&1
+typeset harvest_name
+for harvest_name in "${(@k)aliases}"; do
+    builtin printf 'alias\0%s\0%s\0' "$harvest_name" "${aliases[$harvest_name]}"
+done
+for harvest_name in "${(@k)functions}"; do
+    builtin printf 'function\0%s\0%s\0' "$harvest_name" "${functions_source[$harvest_name]}"
+done
+"""
 
-        self._populate_list()
 
-    def _execute_command(self, command: Command):
-        """Show a fake terminal with the command."""
-        print(f"DEBUG: Executing command: {command.name} = {command.raw_command}")
-        # Store the command to show in fake terminal
-        self._command_to_execute = ( # pylint: disable=attribute-defined-outside-init
-            command.raw_command
-        )
+class RuntimeHarvest:
+    """Functions and aliases as a real zsh defines them (opt-in).
+
+    The lexer only sees literal definitions; aliases made in a loop (like
+    the cloud_commands ones in common.zsh), by eval or by a plugin manager
+    only exist once zsh has run the config. A harvest runs it in ``zsh -f``
+    and saves the live ``aliases``/``functions`` tables to
+    ``~/.cache/launcher_harvest.json``.
+
+    Running zsh takes far longer than a launch, so this is
+    stale-while-revalidate: the launcher merges the last harvest straight
+    away and, when it is older than MAX_AGE or than any source, starts a
+    detached ``launcher.py --harvest-now`` to redo it. The UI picks up the
+    new harvest if it lands while it is open, and the next launch does
+    anyway. Parsed commands always win over harvested ones, and names the
+    config marks launcher-hidden stay hidden.
+
+    Each launch is a new process, so the guard against piling up harvests
+    lives on disk: ``launcher_harvest.json.lock`` is flocked by the running
+    harvest, and its mtime is when the last one was started (see
+    revalidate).
+    """
+
+    DEFAULT_PATH = Path.home() / ".cache" / "launcher_harvest.json"
+    MAX_AGE = 3600  # seconds
+    RETRY_AFTER = 60  # seconds between harvests when they keep failing
+    TIMEOUT = 30  # seconds zsh gets to source the config
+
+    def __init__(self, zsh_file_path: str, path: Optional[Path] = None):
+        # Resolved, so the detached harvest agrees on which config it is for
+        self.zsh_file_path = str(Path(zsh_file_path).resolve())
+        self.path = path or self.DEFAULT_PATH
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.refreshing: Optional[subprocess.Popen] = None
+        self._stamp: Optional[int] = None
+        self._harvested: List[Command] = []
+        self._merged_base: Optional[List[Command]] = None
+        # The launcher-hidden names given to the last merge
+        self.hidden: Set[str] = set()
+        self._merged_stamp: Optional[int] = None
+        self._merged: List[Command] = []
+
+    def _load(self) -> List[Command]:
+        """The last harvest, re-read only if the file changed."""
+        try:
+            stamp = self.path.stat().st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._harvested = []
+            if stamp is not None:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        data = json.load(f)
+                    if data.get("zsh_file") == self.zsh_file_path:
+                        self._harvested = [Command(*row) for row in data["commands"]]
+                except (OSError, ValueError, KeyError, TypeError):
+                    pass  # a bad harvest is the same as none; the next one replaces it
+        return self._harvested
+
+    def merge(self, commands: List[Command], hidden: Set[str]) -> List[Command]:
+        """commands plus harvested ones they don't define or hide.
+
+        Returns the same list as last time while neither input changed, so
+        callers can keep comparing by identity.
+        """
+        harvested = self._load()
+        if commands is self._merged_base and self._stamp == self._merged_stamp:
+            return self._merged
+        merged = merge_commands(commands, harvested, hidden)
+        self._merged_base, self.hidden = commands, hidden
+        self._merged_stamp, self._merged = self._stamp, merged
+        return merged
+
+    def serve(self, parser: "ZshParser") -> List[Command]:
+        """The parser's commands merged with the last harvest; starts a new
+        harvest in the background if that one is stale."""
+        commands = self.merge(parser.commands, parser.hidden)
+        if self.is_stale(parser.sources()):
+            self.revalidate()
+        return commands
+
+    def wait(self) -> Optional[List[Command]]:
+        """Wait for a running harvest; the new merged commands if it changed them."""
+        if self.refreshing is None or self._merged_base is None:
+            return None
+        if self.refreshing.wait() != 0:
+            return None
+        previous = self._merged
+        merged = self.merge(self._merged_base, self.hidden)
+        return None if merged == previous else merged
+
+    def is_stale(self, sources: Iterable[str]) -> bool:
+        """Whether the last harvest is missing, old, or older than a source."""
+        self._load()
+        if self._stamp is None or time.time_ns() - self._stamp > self.MAX_AGE * 10**9:
+            return True
+        for source in sources:
+            try:
+                if os.stat(source).st_mtime_ns > self._stamp:
+                    return True
+            except OSError:
+                continue
+        return False
 
-        # Exit the launcher
-        self.exit()
+    def _lock(self, blocking: bool) -> Optional[int]:
+        """Open and flock the lock file; None if another process holds it."""
+        import fcntl  # pylint: disable=import-outside-toplevel
 
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def revalidate(self):
+        """Start a detached harvest, unless one is running (in any process)
+        or one was started less than RETRY_AFTER ago."""
+        if self.refreshing is not None and self.refreshing.poll() is None:
+            return
+        try:
+            fd = self._lock(blocking=False)
+        except OSError:
+            return  # no cache directory to keep the lock in; don't harvest blind
+        if fd is None:
+            return  # a harvest is running, or another launch is starting one
+        try:
+            stat = os.fstat(fd)
+            # An empty lock file was only just created: nothing has run yet
+            if stat.st_size and time.time() - stat.st_mtime < self.RETRY_AFTER:
+                return
+            os.ftruncate(fd, 0)
+            os.write(fd, f"{os.getpid()}\n".encode("ascii"))  # bumps the mtime
+            # Its own session, so it finishes and saves even after the
+            # launcher (or the terminal) exits. It takes the lock once this
+            # launch lets go; a launch in between sees the fresh mtime
+            self.refreshing = subprocess.Popen(  # pylint: disable=consider-using-with
+                [sys.executable, os.path.abspath(__file__), "--harvest-now"],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        finally:
+            os.close(fd)
+
+    def harvest(self) -> List[Command]:
+        """Run zsh on the config and return what it defines."""
+        with profiler.phase("harvest"):
+            result = subprocess.run(
+                ["zsh", "-f", "-c", _HARVEST_SCRIPT, "zsh", self.zsh_file_path],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                timeout=self.TIMEOUT,
+                check=True,
+            )
+        fields = result.stdout.decode("utf-8", errors="replace").split("\0")
+        commands = []
+        for command_type, name, value in zip(fields[0::3], fields[1::3], fields[2::3]):
+            # Completion functions, zle widgets and the like aren't commands
+            if name == "l" or name[:1] in "_+-." or not re.fullmatch(r"[\w.:@+-]+", name):
+                continue
+            if command_type == "alias":
+                commands.append(Command(name, "", "alias", value))
+            else:
+                commands.append(Command(name, "", "function", name, source=value))
+        return sorted(commands, key=lambda x: x.name)
 
-class FakeTerminalApp(App):
-    """A fake terminal app that shows an editable command."""
+    def refresh(self) -> List[Command]:
+        """Harvest now and save the result atomically, holding the lock
+        file so launches don't start another meanwhile."""
+        lock = self._lock(blocking=True)
+        try:
+            return self._refresh()
+        finally:
+            if lock is not None:
+                os.close(lock)
+
+    def _refresh(self) -> List[Command]:
+        commands = self.harvest()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "zsh_file": self.zsh_file_path,
+                        "harvested_at": time.time(),
+                        "commands": [_command_row(cmd) for cmd in commands],
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return commands
+
+
+_fuzz_module = None
+
+
+def _fuzzywuzzy():
+    """Import fuzzywuzzy on first use; only the fuzzy fallback needs it."""
+    global _fuzz_module  # pylint: disable=global-statement
+    if _fuzz_module is None:
+        with profiler.phase("import:fuzzywuzzy"):
+            # pylint: disable=import-outside-toplevel
+            try:
+                import fuzzywuzzy.fuzz  # pyright: ignore[reportMissingImports]
+                import fuzzywuzzy.process  # pyright: ignore[reportMissingImports]
+            except ImportError:
+                print("Error: fuzzywuzzy library not found. Install with: pip install fuzzywuzzy")
+                sys.exit(1)
+        _fuzz_module = fuzzywuzzy
+    return _fuzz_module
+
+
+@dataclass(**_SLOTS)
+class Match:
+    """A ranked search result; positions index into the command's name and
+    description (for highlighting)."""
+
+    command: Command
+    score: int
+    name_positions: Tuple[int, ...] = ()
+    description_positions: Tuple[int, ...] = ()
+
+
+# Score bands: a better kind of match always outranks a worse one, and within
+# a band (up to 99 points) earlier hits and shorter names come first.
+_NAME_EXACT = 1000
+_NAME_PREFIX = 900
+_NAME_WORD = 800  # starts at a word boundary in the name
+_NAME_SUBSTRING = 700
+_DESCRIPTION_WORD = 600
+_DESCRIPTION_SUBSTRING = 500
+_NAME_SUBSEQUENCE = 300  # every query character, in order, in the name
+# Below that, names within edit distance: fuzzywuzzy's ratio (0-100)
+FUZZY_MIN_RATIO = 50
+
+# Where a match was found, which is all it takes to recompute its positions
+_IN_NAME = 0
+_IN_DESCRIPTION = 1
+_AS_SUBSEQUENCE = 2
+_NO_POSITIONS = 3  # fuzzy matches, and everything for the empty query
+
+
+def _subsequence_pattern(folded: str) -> "re.Pattern":
+    return re.compile(".*?".join(f"({re.escape(char)})" for char in folded), re.DOTALL)
+
+
+class MatchList(Sequence):
+    """Ranked matches, stored as parallel columns of command ids, scores
+    and where each matched.
+
+    Match objects, and their highlight positions, are only built for the
+    rows that are read, so a result of 100k commands costs four small
+    arrays rather than 100k objects, and the virtual list only ever
+    materializes the rows on screen.
+
+    The index's command and name lists are held from construction: update()
+    only appends to them, but a rebuild replaces them, and the ids here
+    must keep naming the commands they were ranked for.
+    """
+
+    __slots__ = (
+        "_commands", "_names", "_folded", "_ids", "_scores", "_kinds", "_starts", "_pattern"
+    )
+
+    def __init__(
+        self,
+        index: "SearchIndex",
+        folded: str,
+        ids: array,
+        scores: array,
+        kinds: bytes,
+        starts: array,
+    ):
+        self._commands = index.commands
+        self._names = index.names
+        self._folded = folded
+        self._ids = ids
+        self._scores = scores
+        self._kinds = kinds
+        self._starts = starts
+        self._pattern: Optional["re.Pattern"] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        command_id = self._ids[item]
+        command = self._commands[command_id]
+        kind, start = self._kinds[item], self._starts[item]
+        span = tuple(range(start, start + len(self._folded)))
+        if kind == _IN_NAME:
+            return Match(command, self._scores[item], span)
+        if kind == _IN_DESCRIPTION:
+            return Match(command, self._scores[item], (), span)
+        if kind == _AS_SUBSEQUENCE:
+            if self._pattern is None:
+                self._pattern = _subsequence_pattern(self._folded)
+            hit = self._pattern.search(self._names[command_id], start)
+            positions = tuple(hit.start(i + 1) for i in range(len(self._folded)))
+            return Match(command, self._scores[item], positions)
+        return Match(command, self._scores[item])
+
+    def command(self, item: int) -> Command:
+        """The command of the item-th match, without building the Match."""
+        return self._commands[self._ids[item]]
+
+
+def _substring_score(text: str, query: str, word_band: int, substring_band: int):
+    """Score the best occurrence of query in text; None if it doesn't occur."""
+    first = index = text.find(query)
+    while index >= 0:
+        if index == 0 or not text[index - 1].isalnum():
+            return word_band + 99 - min(index, 99), index
+        index = text.find(query, index + 1)
+    if first < 0:
+        return None
+    return substring_band + 99 - min(first, 99), first
+
+
+class UsageStore:
+    """Which commands get picked, as exponentially decayed counts.
+
+    Each pick appends ``<unix time>\t<name>`` to a log. Compaction rewrites
+    the log as one ``=<unix time>\t<score>\t<name>`` line per command (its
+    decayed score as of that time), keeping the top ``MAX_ENTRIES``, so the
+    file stays bounded. The log is read on first use, which folds every
+    line into a decayed score and a ranking boost per name; after that a
+    lookup is a dict get.
+    """
+
+    DEFAULT_PATH = Path.home() / ".cache" / "launcher_usage.log"
+    HALF_LIFE_DAYS = 14
+    MAX_ENTRIES = 500
+    COMPACT_AFTER = 200  # picks appended since the last compaction
+    # A boost of BOOST_PER_DOUBLING points each time the score doubles, up
+    # to MAX_BOOST; rank keeps a command within its match band regardless
+    BOOST_PER_DOUBLING = 10
+    MAX_BOOST = 60
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or self.DEFAULT_PATH
+        self._scores: Optional[Dict[str, float]] = None
+        self._boosts: Dict[str, int] = {}
+        self._appended = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._loaded_at = 0.0
+
+    def _decay(self, age_seconds: float) -> float:
+        return 0.5 ** (age_seconds / (self.HALF_LIFE_DAYS * 86400))
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self) -> Dict[str, float]:
+        if self._scores is not None:
+            return self._scores
+        with profiler.phase("usage_load"):
+            now = time.time()
+            scores: Dict[str, float] = {}
+            self._appended = 0
+            self._stamp = self._file_stamp()
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                lines = []
+            for line in lines:
+                try:
+                    if line.startswith("="):
+                        at, score, name = line[1:].split("\t", 2)
+                        weight = float(score)
+                    else:
+                        at, name = line.split("\t", 1)
+                        weight = 1.0
+                        self._appended += 1
+                    scores[name] = scores.get(name, 0.0) + weight * self._decay(now - float(at))
+                except ValueError:
+                    continue  # a torn or foreign line; the next compaction drops it
+            self._scores = scores
+            self._loaded_at = now
+            self._boosts = {name: self._boost_for(score) for name, score in scores.items()}
+        return scores
+
+    def _boost_for(self, score: float) -> int:
+        return min(self.MAX_BOOST, round(self.BOOST_PER_DOUBLING * math.log2(1 + score)))
+
+    def boost(self, name: str) -> int:
+        """Ranking points for how often and how recently name was picked."""
+        if self._scores is None:
+            self._load()
+        return self._boosts.get(name, 0)
+
+    def record(self, name: str):
+        """Log that name was picked; compact once enough picks have piled up."""
+        scores = self._load()
+        now = time.time()
+        scores[name] = scores.get(name, 0.0) * self._decay(now - self._loaded_at) + 1.0
+        self._boosts[name] = self._boost_for(scores[name])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"{now:.0f}\t{name}\n")
+        self._appended += 1
+        if self._appended > self.COMPACT_AFTER:
+            self.compact()
+        self._stamp = self._file_stamp()
+
+    def compact(self):
+        """Rewrite the log as one decayed score per command, keeping the top."""
+        scores = self._load()
+        factor = self._decay(time.time() - self._loaded_at)
+        now = time.time()
+        kept = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        kept = kept[: self.MAX_ENTRIES]
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".launcher_usage.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for name, score in kept:
+                    f.write(f"={now:.0f}\t{score * factor:.6g}\t{name}\n")
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._scores = {name: score * factor for name, score in kept}
+        self._boosts = {name: self._boost_for(score) for name, score in self._scores.items()}
+        self._loaded_at = now
+        self._appended = 0
+
+    def changed(self) -> bool:
+        """Whether another process has written the log since it was read.
+
+        False before the first read, since boost() reads the log as it is then.
+        """
+        return self._scores is not None and self._file_stamp() != self._stamp
+
+
+class SearchCancelled(Exception):
+    """Raised by SearchIndex.rank when its search has been superseded."""
+
+
+class SearchIndex:
+    """Search structures built once when the commands load, and the ranker.
+
+    Names and descriptions are lowercased up front, and each trigram in them
+    maps to the sorted ids of the commands that contain it. A query of three
+    or more characters intersects the postings of its trigrams and only
+    checks the survivors, so a keystroke costs about as much as its matches
+    instead of a scan over every command. Shorter queries match most
+    commands anyway and scan the pre-folded strings. All postings share one
+    ``array('I')``; each trigram maps to its slice of it.
+
+    While typing, each query usually extends the previous one, and anything
+    containing the longer query contains the shorter one too, so the ids
+    that contained the previous query are the candidates for the next.
+    Ranked results are kept in a small LRU cache, which serves backspace
+    and repeated queries without scoring anything.
+
+    ``update`` patches the index in place when a source changes: replaced
+    and removed commands are marked dead, new ones get fresh ids and their
+    own small postings, and only the name order is recomputed. Once
+    patches pile up past a quarter of the index it is rebuilt.
+    """
+
+    GRAM = 3
+    CACHE_SIZE = 64
+    # How many commands to score between checks for cancellation
+    CANCEL_CHECK_EVERY = 1024
+    # Patched commands tolerated before a rebuild (or a quarter of the index)
+    REBUILD_AFTER = 256
+
+    def __init__(
+        self,
+        commands: List[Command],
+        postings: bool = True,
+        usage: Optional[UsageStore] = None,
+    ):
+        self.usage = usage
+        self._with_postings = postings
+        # Held while ranking or patching; ranks come from worker and server threads
+        self._lock = threading.RLock()
+        self._build(commands)
+
+    def _build(self, commands: List[Command]):
+        self.commands = list(commands)
+        self.names = [_fold(cmd.name) for cmd in commands]
+        self.descriptions = [_fold(cmd.description) for cmd in commands]
+        # Live ids in list order, and each id's place in it, for ties
+        self._by_name = array("I", range(len(commands)))
+        self._position = array("I", range(len(commands)))
+        self._dead: Set[int] = set()
+        self._base_count = len(commands)
+
+        # One-off queries (--query) skip the postings: building them costs
+        # more than the single scan they would save
+        self._postings: Optional[Dict[str, int]] = None
+        self._posting_ids = array("I")
+        # Postings of commands added by update() since the last build
+        self._extra_postings: Dict[str, array] = {}
+        if self._with_postings:
+            grams: Dict[str, array] = {}
+            for command_id, (name, description) in enumerate(
+                zip(self.names, self.descriptions)
+            ):
+                for gram in self._grams(name) | self._grams(description):
+                    posting = grams.get(gram)
+                    if posting is None:
+                        posting = grams[gram] = array("I")
+                    posting.append(command_id)
+            # Each trigram's slice of _posting_ids, packed as start << 32 | end
+            self._postings = {}
+            for gram, posting in grams.items():
+                start = len(self._posting_ids)
+                self._posting_ids.extend(posting)
+                self._postings[gram] = start << 32 | len(self._posting_ids)
+
+        self._forget()
+
+    def set_usage(self, usage: Optional["UsageStore"]):
+        """Rank with usage from now on. Boosts are only read when ranking,
+        so the postings stay; cached results are dropped."""
+        with self._lock:
+            self.usage = usage
+            self._forget()
+
+    def _forget(self):
+        # (folded query, limit) -> (matches, ids containing the query)
+        self._cache: "OrderedDict[tuple, Tuple[MatchList, array]]" = OrderedDict()
+        # The last query scored and the ids that contained it
+        self._last: Tuple[str, array] = ("", array("I"))
+
+    def update(self, commands: List[Command]) -> bool:
+        """Patch the index to hold commands instead; returns whether
+        anything changed. Only commands that were added, removed or changed
+        are touched, and cached results are dropped."""
+        with self._lock:
+            live = {self.commands[command_id].name: command_id for command_id in self._by_name}
+            names = set()
+            added: List[Command] = []
+            removed: List[int] = []
+            for cmd in commands:
+                names.add(cmd.name)
+                command_id = live.get(cmd.name)
+                if command_id is None or self.commands[command_id] != cmd:
+                    added.append(cmd)
+                    if command_id is not None:
+                        removed.append(command_id)
+            removed.extend(command_id for name, command_id in live.items() if name not in names)
+            if not added and not removed:
+                return False
 
-    BINDINGS = [
-        Binding("ctrl+c", "quit", "Cancel"),
-        Binding("escape", "quit", "Cancel"),
-    ]
+            patched = len(self._dead) + len(self.commands) - self._base_count
+            if patched + len(added) + len(removed) > max(
+                self.REBUILD_AFTER, self._base_count // 4
+            ):
+                self._build(commands)
+                return True
+
+            self._dead.update(removed)
+            for cmd in added:
+                command_id = len(self.commands)
+                self.commands.append(cmd)
+                self.names.append(_fold(cmd.name))
+                self.descriptions.append(_fold(cmd.description))
+                if self._postings is not None:
+                    for gram in self._grams(self.names[-1]) | self._grams(self.descriptions[-1]):
+                        self._extra_postings.setdefault(gram, array("I")).append(command_id)
+            order = {cmd.name: place for place, cmd in enumerate(commands)}
+            self._by_name = array(
+                "I",
+                sorted(
+                    (
+                        command_id
+                        for command_id in range(len(self.commands))
+                        if command_id not in self._dead
+                    ),
+                    key=lambda command_id: order[self.commands[command_id].name],
+                ),
+            )
+            self._position = array("I", bytes(4 * len(self.commands)))
+            for place, command_id in enumerate(self._by_name):
+                self._position[command_id] = place
+            self._forget()
+            return True
 
-    def __init__(self, initial_command: str, zsh_file_path: str):
-        super().__init__()
-        self.initial_command = initial_command
-        self.zsh_file_path = zsh_file_path
+    @classmethod
+    def _grams(cls, text: str) -> set:
+        return {text[i : i + cls.GRAM] for i in range(len(text) - cls.GRAM + 1)}
+
+    def _candidates(self, folded: str) -> Iterable[int]:
+        """Ids of commands that contain every trigram of the folded query."""
+        if self._postings is None or len(folded) < self.GRAM:
+            return self._by_name
+        if self._dead or self._extra_postings:
+            return self._patched_candidates(folded)
+        ranges = []
+        for gram in self._grams(folded):
+            packed = self._postings.get(gram)
+            if packed is None:
+                return ()
+            ranges.append((packed >> 32, packed & 0xFFFFFFFF))
+        ranges.sort(key=lambda bounds: bounds[1] - bounds[0])
+        ids = self._posting_ids
+        (start, end), others = ranges[0], ranges[1:]
+        return array(
+            "I",
+            (
+                command_id
+                for command_id in ids[start:end]
+                if all(_contains_sorted(ids, command_id, lo, hi) for lo, hi in others)
+            ),
+        )
 
-    def compose(self) -> ComposeResult:
-        """Create the fake terminal interface."""
-        yield Header()
-        yield Container(
-            Static("Command-", id="prompt"),
-            Input(value=self.initial_command, id="command_input"),
-            Static("Enter to execute", id="instructions"),
-            id="terminal",
+    def _patched_candidates(self, folded: str) -> Iterable[int]:
+        """_candidates once update() has patched the index: sets over the
+        base and the extra postings, without the dead ids."""
+        survivors: Optional[set] = None
+        for gram in self._grams(folded):
+            packed = self._postings.get(gram, 0)
+            ids = set(self._posting_ids[packed >> 32 : packed & 0xFFFFFFFF])
+            ids.update(self._extra_postings.get(gram, ()))
+            survivors = ids if survivors is None else survivors & ids
+            if not survivors:
+                return ()
+        return array("I", sorted(survivors - self._dead))
+
+    def _score_contained(self, command_id: int, folded: str) -> Optional[Tuple[int, int, int]]:
+        """Score a command whose name or description contains the query;
+        returns (score, where, start)."""
+        name = self.names[command_id]
+        if name == folded:
+            return _NAME_EXACT, _IN_NAME, 0
+        if name.startswith(folded):
+            return _NAME_PREFIX + 99 - min(len(name) - len(folded), 99), _IN_NAME, 0
+        hit = _substring_score(name, folded, _NAME_WORD, _NAME_SUBSTRING)
+        if hit is not None:
+            return hit[0], _IN_NAME, hit[1]
+        hit = _substring_score(
+            self.descriptions[command_id],
+            folded,
+            _DESCRIPTION_WORD,
+            _DESCRIPTION_SUBSTRING,
         )
-        yield Footer()
-
-    def on_mount(self) -> None:
-        """Called when the fake terminal starts."""
-        # Focus the input field
-        input_field = self.query_one("#command_input", Input)
-        input_field.focus()
-
-    def on_input_submitted(self, event: Input.Submitted) -> None:
-        """Called when Enter is pressed in the input field."""
-        if event.input.id == "command_input":
-            self._execute_command(event.value)
-
-    def _execute_command(self, command: str):
-        """Execute the command and exit."""
-        # Store the command to execute after the app exits
-        self._command_to_execute = ( # pylint: disable=attribute-defined-outside-init
-            command
+        if hit is not None:
+            return hit[0], _IN_DESCRIPTION, hit[1]
+        return None
+
+    def _score_loose(
+        self, command_id: int, folded: str, subsequence: "re.Pattern"
+    ) -> Optional[Tuple[int, int, int]]:
+        """Score a command by subsequence, then by edit distance, on its name."""
+        name = self.names[command_id]
+        match = subsequence.search(name)
+        if match is not None:
+            first, last = match.start(1), match.start(len(folded))
+            spread = last - first + 1 - len(folded)
+            return _NAME_SUBSEQUENCE + 99 - min(spread + first, 99), _AS_SUBSEQUENCE, first
+        # The ratio can't beat 200 * shorter / (both lengths); skip hopeless names
+        if 200 * min(len(name), len(folded)) <= FUZZY_MIN_RATIO * (len(name) + len(folded)):
+            return None
+        score = _fuzzywuzzy().fuzz.ratio(folded, name)
+        if score >= FUZZY_MIN_RATIO:
+            return score, _NO_POSITIONS, 0
+        return None
+
+    def rank(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> MatchList:
+        """Score every command against query in one pass; return the best.
+
+        Each command is scored once, by the best way it matches: exact,
+        prefix, word boundary or substring of its name, then of its
+        description, then subsequence or edit distance of its name. The
+        best ``limit`` are picked with a bounded heap. Commands that don't
+        contain the query only need scoring when the containing ones don't
+        fill the limit (without a limit: when there are none), as they can
+        never outrank them. With a usage store, frequently and recently
+        picked commands gain up to UsageStore.MAX_BOOST points, but never
+        leave their band; an empty query lists them first.
+
+        Scores and hits are collected in flat arrays and returned as a
+        MatchList, which builds Match objects only for the rows read.
+
+        ``cancelled`` is polled while scoring; once it returns True the
+        search stops with SearchCancelled and nothing is cached.
+        """
+        if not query:
+            return self._rank_empty(limit)
+
+        folded = query.lower()
+        with self._lock:
+            cached = self._cache.get((folded, limit))
+            if cached is not None:
+                self._cache.move_to_end((folded, limit))
+            else:
+                cached = self._rank(folded, limit, cancelled)
+                self._cache[(folded, limit)] = cached
+                if len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            matches, contained = cached
+            self._last = (folded, contained)
+        return matches
+
+    def _rank_empty(self, limit: Optional[int]) -> MatchList:
+        """Every command in name order, the ones picked before first."""
+        by_name = self._by_name
+        count = len(by_name) if limit is None else min(limit, len(by_name))
+        if self.usage is None:
+            order: Iterable[int] = by_name[:count]
+            scores = array("i", bytes(4 * count))
+        else:
+            boost = self.usage.boost
+            boosts = {command_id: boost(self.commands[command_id].name) for command_id in by_name}
+            used = sorted(
+                (command_id for command_id in by_name if boosts[command_id]),
+                key=lambda command_id: -boosts[command_id],
+            )
+            order = used + [command_id for command_id in by_name if not boosts[command_id]]
+            order = order[:count]
+            scores = array("i", (boosts[command_id] for command_id in order))
+        return MatchList(
+            self,
+            "",
+            array("I", order),
+            scores,
+            bytes([_NO_POSITIONS]) * count,
+            array("I", bytes(4 * count)),
         )
-        self._zsh_file = ( # pylint: disable=attribute-defined-outside-init
-            self.zsh_file_path
+
+    def _rank(
+        self, folded: str, limit: Optional[int], cancelled: Optional[Callable[[], bool]]
+    ) -> Tuple[MatchList, array]:
+        last_query, last_contained = self._last
+        if last_query and folded.startswith(last_query):
+            candidates: Iterable[int] = last_contained
+        else:
+            candidates = self._candidates(folded)
+
+        check_every = self.CANCEL_CHECK_EVERY
+
+        def check(scanned: int):
+            if cancelled is not None and scanned % check_every == 0 and cancelled():
+                raise SearchCancelled(folded)
+
+        # Every hit, as columns: the contained ones first, then any loose ones
+        ids, scores, kinds, starts = array("I"), array("i"), bytearray(), array("I")
+        boost = self.usage.boost if self.usage is not None else None
+
+        def offer(command_id: int, scored: Tuple[int, int, int]):
+            score, kind, start = scored
+            if boost is not None:
+                score = min(score - score % 100 + 99, score + boost(self.commands[command_id].name))
+            ids.append(command_id)
+            scores.append(score)
+            kinds.append(kind)
+            starts.append(start)
+
+        for scanned, command_id in enumerate(candidates):
+            check(scanned)
+            scored = self._score_contained(command_id, folded)
+            if scored is not None:
+                offer(command_id, scored)
+        contained = ids[:]
+
+        if not ids or (limit is not None and len(ids) < limit):
+            skip = set(contained)
+            subsequence = _subsequence_pattern(folded)
+            for scanned, command_id in enumerate(self._by_name):
+                check(scanned)
+                if command_id in skip:
+                    continue
+                scored = self._score_loose(command_id, folded, subsequence)
+                if scored is not None:
+                    offer(command_id, scored)
+
+        # Best first; equal scores keep command (name) order. One int per
+        # hit sorts them: score, then name position reversed, then the hit
+        position = self._position
+        keys = [
+            score << 64 | (0xFFFFFFFF - position[ids[hit]]) << 32 | hit
+            for hit, score in enumerate(scores)
+        ]
+        if limit is None:
+            keys.sort(reverse=True)
+        else:
+            keys = heapq.nlargest(limit, keys)
+        order = [key & 0xFFFFFFFF for key in keys]
+        del keys
+        matches = MatchList(
+            self,
+            folded,
+            array("I", (ids[hit] for hit in order)),
+            array("i", (scores[hit] for hit in order)),
+            bytes(kinds[hit] for hit in order),
+            array("I", (starts[hit] for hit in order)),
         )
+        return matches, contained
+
+    def filter(self, query: str) -> List[Command]:
+        """Filter commands based on query, best matches first."""
+        matches = self.rank(query)
+        return [matches.command(i) for i in range(len(matches))]
+
+
+def _fold(text: str) -> str:
+    """text lowercased, sharing the original string when it already is."""
+    folded = text.lower()
+    return text if folded == text else folded
+
+
+def _contains_sorted(ids: array, value: int, lo: int, hi: int) -> bool:
+    index = bisect_left(ids, value, lo, hi)
+    return index < hi and ids[index] == value
+
+
+class SourceWatcher:
+    """Calls ``on_change`` whenever one of ``paths`` changes.
+
+    Uses inotify through ctypes (no extra packages) where the C library has
+    it, watching the files' directories so that editors which save by
+    writing a new file and renaming it over the old one are caught too.
+    Elsewhere (macOS), or if inotify can't be set up, it polls the files'
+    stat every POLL_SECONDS. A burst of events is given SETTLE_SECONDS to
+    finish, so one save means one call. ``paths`` may be reassigned from
+    ``on_change`` when the set of sources changes.
+    """
+
+    POLL_SECONDS = 1.0
+    SETTLE_SECONDS = 0.05
+    # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _INOTIFY_MASK = 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+    # struct inotify_event: wd, mask, cookie, len, then len bytes of name
+    _INOTIFY_EVENT = struct.Struct("iIII")
+
+    def __init__(self, paths: Iterable[str], on_change: Callable[[], None]):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.on_change = on_change
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stop watching; run() returns within a poll interval."""
+        self._stop.set()
+
+    def run(self):
+        """Watch until stop() is called."""
+        fd, add_watch = self._inotify()
+        if fd is None:
+            self._poll()
+            return
+        try:
+            self._watch(fd, add_watch)
+        finally:
+            os.close(fd)
 
-        # Exit the fake terminal
-        self.exit()
+    @staticmethod
+    def _inotify():
+        """An inotify fd and the add-watch function, or (None, None)."""
+        import ctypes  # pylint: disable=import-outside-toplevel
+
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return None, None
+        fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None, None
+        add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        return fd, add_watch
+
+    def _watch(self, fd: int, add_watch):
+        import select  # pylint: disable=import-outside-toplevel
+
+        directories: Dict[int, bytes] = {}
+        while not self._stop.is_set():
+            for directory in {os.path.dirname(path) for path in self.paths}:
+                encoded = os.fsencode(directory)
+                if encoded not in directories.values():
+                    wd = add_watch(fd, encoded, self._INOTIFY_MASK)
+                    if wd >= 0:
+                        directories[wd] = encoded
+            if not select.select([fd], [], [], self.POLL_SECONDS)[0]:
+                continue
+            changed = set()
+            while True:
+                changed.update(self._read_events(fd, directories))
+                time.sleep(self.SETTLE_SECONDS)
+                if not select.select([fd], [], [], 0)[0]:
+                    break
+            if changed & {os.fsencode(path) for path in self.paths}:
+                self.on_change()
+
+    def _read_events(self, fd: int, directories: Dict[int, bytes]) -> List[bytes]:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = self._INOTIFY_EVENT.unpack_from(data, offset)
+            offset += self._INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if wd in directories:
+                paths.append(os.path.join(directories[wd], name))
+        return paths
+
+    def _poll(self):
+        def stamps() -> Dict[str, Optional[Tuple[int, int, int]]]:
+            result = {}
+            for path in self.paths:
+                try:
+                    stat = os.stat(path)
+                    result[path] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    result[path] = None
+            return result
+
+        last = stamps()
+        while not self._stop.wait(self.POLL_SECONDS):
+            current = stamps()
+            if current != last:
+                last = current
+                self.on_change()
+                last = stamps()  # paths may have changed
+
+
+class FunctionBodies:
+    """Function bodies for the preview, read only when asked for.
+
+    Each source file is mmapped on first use and a body is sliced out by
+    the byte offsets stored in the index, so nothing is read for commands
+    that are never previewed. The last ``CACHE_SIZE`` bodies are kept.
+    A source is re-stat'ed on each lookup and remapped if it changed, so
+    previews follow edits picked up by the watcher.
+    """
+
+    CACHE_SIZE = 128
+
+    def __init__(self):
+        self._maps: Dict[str, Tuple[tuple, Optional[mmap.mmap]]] = {}
+        self._bodies: "OrderedDict[tuple, Optional[Tuple[str, int]]]" = OrderedDict()
+
+    def _map(self, source: str) -> Tuple[tuple, Optional[mmap.mmap]]:
+        try:
+            stat = os.stat(source)
+            stamp: tuple = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stamp = ()
+        mapped = self._maps.get(source)
+        if mapped is None or mapped[0] != stamp:
+            if mapped is not None and mapped[1] is not None:
+                mapped[1].close()
+            mm = None
+            try:
+                with open(source, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # ValueError: empty file
+                pass
+            mapped = self._maps[source] = (stamp, mm)
+        return mapped
+
+    def body(self, command: Command) -> Optional[Tuple[str, int]]:
+        """A function's dedented body and the line of its opening brace, or None."""
+        if command.command_type != "function" or command.body_end <= command.body_start:
+            return None
+        stamp, mm = self._map(command.source)
+        key = (command.source, stamp, command.body_start, command.body_end)
+        if key in self._bodies:
+            self._bodies.move_to_end(key)
+            return self._bodies[key]
+
+        body = None
+        # The offsets come from the index; the closing brace should still be
+        # where they say, unless the file was edited since
+        if mm is not None and mm[command.body_end : command.body_end + 1] == b"}":
+            text = mm[command.body_start : command.body_end].decode("utf-8", "replace")
+            line = mm[: command.body_start].count(b"\n") + 1
+            body = (textwrap.dedent(text).strip("\n"), line)
+        self._bodies[key] = body
+        if len(self._bodies) > self.CACHE_SIZE:
+            self._bodies.popitem(last=False)
+        return body
+
+    def close(self):
+        """Unmap the source files."""
+        for _, mm in self._maps.values():
+            if mm is not None:
+                mm.close()
+        self._maps.clear()
+
+
+def _load_tui():
+    """Import the Textual UI; only done once the launcher is about to show it."""
+    with profiler.phase("import:launcher_tui"):
+        import launcher_tui  # pylint: disable=import-outside-toplevel
+    return launcher_tui
 
 
 class Launcher:
     """Wrapper class for the Textual app."""
 
-    def __init__(self, commands: List[Command], zsh_file_path: str):
+    def __init__(
+        self,
+        commands: List[Command],
+        zsh_file_path: str,
+        harvest: Optional[RuntimeHarvest] = None,
+        ingest: Optional[BulkIngest] = None,
+        server: Optional["ServerIndex"] = None,
+    ):
         self.commands = commands
         self.zsh_file_path = zsh_file_path
+        self.harvest = harvest
+        self.ingest = ingest
+        self.server = server
+        self.index: Optional[SearchIndex] = None
+
+    def _replace(self, app, commands: List[Command]):
+        """Patch the index to commands and hand them to the app if they changed."""
+        if self.index.update(commands):
+            app.call_from_thread(app.replace_commands, commands, self.index.rank)
+
+    def _await_harvest(self, app):
+        """Hand the app the harvest running in the background, once it lands."""
+        try:
+            commands = self.harvest.wait()
+            if commands is not None:
+                if self.ingest is not None:
+                    commands = self.ingest.merge(commands, self.harvest.hidden)
+                self._replace(app, commands)
+        except Exception:  # pylint: disable=broad-exception-caught
+            pass  # the app has exited, or zsh failed; the next launch retries
+
+    def _watch(self, app, watcher: SourceWatcher):
+        """Re-parse when a source changes while the app is open."""
+        parser = ZshParser(self.zsh_file_path)
+
+        def sources() -> List[str]:
+            paths = parser.sources()
+            if self.ingest is not None:
+                paths += self.ingest.sources()
+            return paths
+
+        def reload():
+            try:
+                # Only the changed files are re-read; the rest pass the stat check
+                commands = parser.parse()
+                if self.harvest is not None:
+                    commands = self.harvest.merge(commands, parser.hidden)
+                if self.ingest is not None:
+                    commands = self.ingest.merge(commands, parser.hidden)
+                watcher.paths = sources()
+                self._replace(app, commands)
+            except RuntimeError:
+                watcher.stop()  # the app has exited
+            except (OSError, ValueError):
+                pass  # a half-written file; the save that finishes it fires again
 
-    def run(self, command_file=None):
-        """Run the interactive launcher."""
-        app = LauncherApp(self.commands, self.zsh_file_path)
-        app.run()
+        try:
+            parser.parse()  # warm from the index; just learns the sources
+            watcher.paths = sources()
+        except (OSError, ValueError):
+            pass
+        watcher.on_change = reload
+        watcher.run()
+
+    def run(self, command_file=None, handoff_fd: Optional[int] = None):
+        """Run the interactive launcher.
+
+        The chosen command goes to handoff_fd (see handoff_record), else
+        to command_file, else it is run here. With a server, it ranks, and
+        re-stats the sources on every search, so nothing is watched here.
+        """
+        usage = UsageStore()
+        bodies = FunctionBodies()
+        if self.server is not None:
+            rank = self.server.rank
+        else:
+            self.index = SearchIndex(self.commands, usage=usage)
+            rank = self.index.rank
+        app = _load_tui().LauncherApp(
+            self.commands,
+            self.zsh_file_path,
+            rank,
+            profiler,
+            bodies.body,
+        )
+        watcher = None
+        if self.server is None:
+            if self.harvest is not None and self.harvest.refreshing is not None:
+                threading.Thread(target=self._await_harvest, args=(app,), daemon=True).start()
+            watcher = SourceWatcher([self.zsh_file_path], lambda: None)
+            threading.Thread(target=self._watch, args=(app, watcher), daemon=True).start()
+        try:
+            app.run()
+        finally:
+            if watcher is not None:
+                watcher.stop()
+            if self.server is not None:
+                self.server.close()
+            bodies.close()
+        if app.selected_command is not None:
+            usage.record(app.selected_command.name)
 
         # Handle command execution based on how we're called
         if hasattr(app, "_command_to_execute"):
-            if command_file:
+            if handoff_fd is not None:
+                # Being called from the `l` function, which evals the record
+                record = handoff_record(
+                    app.selected_command,
+                    app._command_to_execute,  # pylint: disable=protected-access
+                    _logical_cwd(),
+                )
+                with open(handoff_fd, "wb", closefd=True) as f:
+                    f.write(record)
+            elif command_file:
                 # Being called from shell function, write command to file
                 with open(command_file, "w", encoding="utf-8") as f:
                     f.write(app._command_to_execute)  # pylint: disable=protected-access
@@ -442,7 +2175,7 @@ class Launcher:
     def _show_fake_terminal(self, command: str):
         """Show a fake terminal with the command ready to execute."""
         # Create and run a fake terminal app
-        fake_terminal = FakeTerminalApp(command, self.zsh_file_path)
+        fake_terminal = _load_tui().FakeTerminalApp(command, self.zsh_file_path)
         fake_terminal.run()
 
         # Output the command for the shell function to execute
@@ -482,6 +2215,513 @@ class Launcher:
             print(f"\nError: {e}")
 
 
+def _logical_cwd() -> str:
+    """$PWD when it names the working directory, else os.getcwd().
+
+    os.getcwd() resolves symlinks, while the shell's $PWD keeps the path
+    it was given; handing back the physical path would look like a cd.
+    """
+    cwd = os.getcwd()
+    pwd = os.environ.get("PWD")
+    try:
+        if pwd and os.path.samefile(pwd, cwd):
+            return pwd
+    except OSError:
+        pass
+    return cwd
+
+
+def handoff_record(command: Command, command_line: str, cwd: str) -> bytes:
+    """The chosen command as the `l` function reads it from the handoff fd.
+
+    Four NUL-separated fields: the command's type (function or alias), its
+    name, the command line to eval and the directory to run it in. There is
+    no trailing separator, since zsh's $(...) would keep it as an empty
+    field; `l` splits the record with ${(@0)...}. Nothing is written when
+    the launcher is cancelled.
+    """
+    fields = (command.command_type, command.name, command_line, cwd)
+    return b"\0".join(field.encode("utf-8", "surrogateescape") for field in fields)
+
+
+def default_socket_path() -> Path:
+    """Where the launcher server listens: $XDG_RUNTIME_DIR or ~/.cache."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    base = Path(runtime_dir) if runtime_dir else Path.home() / ".cache"
+    return base / "launcher.sock"
+
+
+def _command_row(cmd: Command) -> list:
+    return [
+        cmd.name,
+        cmd.description,
+        cmd.command_type,
+        cmd.raw_command,
+        cmd.source,
+        cmd.body_start,
+        cmd.body_end,
+    ]
+
+
+def _match_row(match: Match) -> list:
+    return [
+        _command_row(match.command),
+        match.score,
+        match.name_positions,
+        match.description_positions,
+    ]
+
+
+class LauncherServer:
+    """Keeps the commands and their SearchIndex warm, serving a Unix socket.
+
+    Requests and responses are one JSON object per line:
+
+        {"op": "commands"}  -> {"commands": [[name, ...], ...]}
+        {"op": "filter", "query": "gi", "limit": 10}  -> {"matches": [...]}
+        {"op": "filter", "query": "gi", "offset": 200, "limit": 200}
+            -> {"matches": [...], "total": 1234}
+        {"op": "ping"}  -> {"ok": true}
+
+    With an offset, filter answers one page of the full ranking, which is
+    kept until the query or the commands change; that is how a launcher UI
+    pages through results it never ranks itself (see ServerIndex).
+
+    Every request first re-stats the zsh sources (no reads unless one
+    changed), so edits are picked up without restarting the server.
+    Ingested files are stat-checked at most once per INGEST_RECHECK_AFTER,
+    since there can be thousands and a search is a request per keystroke.
+    """
+
+    INGEST_RECHECK_AFTER = 1.0  # seconds
+
+    def __init__(
+        self,
+        zsh_file_path: str,
+        socket_path: Path,
+        harvest: Optional[RuntimeHarvest] = None,
+        ingest: Optional[BulkIngest] = None,
+    ):
+        self.parser = ZshParser(zsh_file_path)
+        self.socket_path = socket_path
+        self.harvest = harvest
+        self.ingest = ingest
+        self.commands: List[Command] = []
+        self.usage = UsageStore()
+        self.index = SearchIndex([], usage=self.usage)
+        self._lock = threading.Lock()
+        # (query, usage, commands, matches) of the last paged filter
+        self._ranked: Optional[Tuple[str, UsageStore, List[Command], Sequence[Match]]] = None
+
+    def refresh(self) -> List[Command]:
+        """Re-parse any changed sources; return the current commands."""
+        with self._lock:
+            commands = self.parser.parse()
+            if self.harvest is not None:
+                commands = self.harvest.serve(self.parser)
+            if self.ingest is not None:
+                commands = self.ingest.merge(
+                    commands, self.parser.hidden, self.INGEST_RECHECK_AFTER
+                )
+            if self.usage.changed():
+                # Picks from launcher clients land in the log; reread it.
+                # Every boost may have moved, but only cached results used them
+                self.usage = UsageStore(self.usage.path)
+                self.index.set_usage(self.usage)
+            if commands is not self.commands:
+                self.index.update(commands)
+            if self.commands and commands is not self.commands:
+                print(f"Reloaded {len(commands)} commands", file=sys.stderr)
+            self.commands = commands
+            return self.commands
+
+    def handle(self, request: dict) -> dict:
+        """Answer one request."""
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "commands":
+            return {"commands": [_command_row(cmd) for cmd in self.refresh()]}
+        if op == "filter":
+            commands = self.refresh()
+            query = str(request.get("query", ""))
+            limit = request.get("limit")
+            limit = None if limit is None else int(limit)
+            if "offset" in request:
+                return self._page(query, commands, int(request["offset"]), limit)
+            matches = self.index.rank(query, limit)
+            return {"matches": [_match_row(match) for match in matches]}
+        return {"error": f"unknown op: {op!r}"}
+
+    def _page(
+        self, query: str, commands: List[Command], offset: int, limit: Optional[int]
+    ) -> dict:
+        """One page of the full ranking for query, ranked once per query."""
+        ranked = self._ranked
+        if (
+            ranked is None
+            or ranked[0] != query
+            or ranked[1] is not self.usage
+            or ranked[2] is not commands
+        ):
+            ranked = self._ranked = (query, self.usage, commands, self.index.rank(query))
+        matches = ranked[3]
+        end = None if limit is None else offset + limit
+        return {
+            "matches": [_match_row(match) for match in matches[offset:end]],
+            "total": len(matches),
+        }
+
+    def serve_forever(self):
+        """Listen on the socket until interrupted."""
+        import signal  # pylint: disable=import-outside-toplevel
+        import socketserver  # pylint: disable=import-outside-toplevel
+
+        server_ref = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            """Reads JSON requests from one client until it disconnects."""
+
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = server_ref.handle(json.loads(line))
+                    except (ValueError, TypeError, OSError) as e:
+                        response = {"error": str(e)}
+                    self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        if self.socket_path.exists():
+            if _daemon_request({"op": "ping"}, self.socket_path) is not None:
+                raise OSError(f"A launcher server is already running on {self.socket_path}")
+            self.socket_path.unlink()  # stale socket from a crashed server
+
+        self.refresh()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        with socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler) as server:
+            server.daemon_threads = True
+            os.chmod(self.socket_path, 0o600)
+            print(
+                f"Serving {len(self.commands)} commands on {self.socket_path}",
+                file=sys.stderr,
+            )
+            # Clean up the socket when stopped by a service manager too
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.socket_path.unlink(missing_ok=True)
+
+
+def _daemon_request(request: dict, socket_path: Optional[Path] = None) -> Optional[dict]:
+    """Send one request to a running launcher server; None if there isn't one."""
+    socket_path = socket_path or default_socket_path()
+    if not socket_path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+        response = json.loads(line)
+    except (OSError, ValueError):
+        return None  # not running, stale socket or garbled reply
+    if not isinstance(response, dict) or "error" in response:
+        return None
+    return response
+
+
+def _read_match(row: list) -> Match:
+    command, score, name_positions, description_positions = row
+    return Match(Command(*command), score, tuple(name_positions), tuple(description_positions))
+
+
+class ServerMatches(Sequence):
+    """A ranking held by the launcher server, read a page at a time.
+
+    Only the pages of rows that are read cross the socket, so the virtual
+    list can scroll 100k results while the UI holds a few hundred. If the
+    server stops answering, the rest is ranked locally instead.
+    """
+
+    def __init__(self, server: "ServerIndex", query: str, first: dict):
+        self._server = server
+        self._query = query
+        self._total: int = first["total"]
+        self._pages: Dict[int, List[Match]] = {0: [_read_match(row) for row in first["matches"]]}
+        self._local: Optional[Sequence[Match]] = None
+
+    def __len__(self) -> int:
+        return self._total if self._local is None else len(self._local)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if self._local is not None:
+            return self._local[item]
+        if item < 0:
+            item += self._total
+        if not 0 <= item < self._total:
+            raise IndexError(item)
+        number, row = divmod(item, ServerIndex.PAGE)
+        page = self._pages.get(number)
+        if page is None:
+            response = self._server.page(self._query, number * ServerIndex.PAGE)
+            if response is None:
+                self._local = self._server.local().rank(self._query)
+                return self._local[item]
+            page = self._pages[number] = [_read_match(row) for row in response["matches"]]
+        return page[row]
+
+
+class ServerIndex:
+    """Ranks through a running launcher server instead of a local SearchIndex.
+
+    The launcher UI uses it when the server is up, so a launch neither
+    loads every command as JSON nor builds postings for them: each search
+    is one filter request, and results arrive as ServerMatches. One
+    connection is kept for the session. Should the server go away, ranking
+    falls back to a SearchIndex over the commands load() returns.
+    """
+
+    PAGE = 200
+
+    def __init__(self, sock: socket.socket, load: Callable[[], List[Command]]):
+        self._sock: Optional[socket.socket] = sock
+        self._reader = sock.makefile("rb")
+        self._load = load
+        self._local: Optional[SearchIndex] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(
+        cls, load: Callable[[], List[Command]], socket_path: Optional[Path] = None
+    ) -> Optional["ServerIndex"]:
+        """Connect to the launcher server; None if there isn't one."""
+        socket_path = socket_path or default_socket_path()
+        if not socket_path.exists():
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(str(socket_path))
+        except OSError:
+            sock.close()
+            return None  # a stale socket from a crashed server
+        return cls(sock, load)
+
+    def page(self, query: str, offset: int) -> Optional[dict]:
+        """One page of the server's ranking for query; None once it's gone."""
+        request = {"op": "filter", "query": query, "offset": offset, "limit": self.PAGE}
+        with self._lock:
+            if self._sock is None:
+                return None
+            try:
+                self._sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+                response = json.loads(self._reader.readline())
+            except (OSError, ValueError):
+                response = None
+            if not isinstance(response, dict) or "error" in response:
+                self._close()
+                return None
+        return response
+
+    def local(self) -> SearchIndex:
+        """The fallback index, built the first time the server fails."""
+        with self._lock:
+            if self._local is None:
+                self._local = SearchIndex(self._load(), usage=UsageStore())
+            return self._local
+
+    def rank(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Sequence[Match]:
+        """SearchIndex.rank, answered by the server while it is up."""
+        if self._local is None:
+            response = self.page(query, 0)
+            if response is not None:
+                matches = ServerMatches(self, query, response)
+                return matches if limit is None else matches[:limit]
+        return self.local().rank(query, limit, cancelled)
+
+    def close(self):
+        """Hang up on the server."""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = None
+
+
+def parse_commands(
+    zsh_file_path: str,
+    harvest: Optional[RuntimeHarvest] = None,
+    ingest: Optional[BulkIngest] = None,
+) -> List[Command]:
+    """Parse the commands here, merging the harvest and ingest if given."""
+    with profiler.phase("parse"):
+        parser = ZshParser(zsh_file_path)
+        commands = parser.parse()
+    if harvest is not None:
+        commands = harvest.serve(parser)
+    if ingest is not None:
+        commands = ingest.merge(commands, parser.hidden)
+    return commands
+
+
+def _tsv_field(text: str) -> str:
+    return text.replace("\t", " ").replace("\n", " ")
+
+
+def run_query(
+    zsh_file_path: str,
+    query: str,
+    limit: Optional[int],
+    output_format: str,
+    harvest: Optional[RuntimeHarvest] = None,
+    ingest: Optional[BulkIngest] = None,
+) -> int:
+    """Print commands matching query to stdout, one per line, without the UI.
+
+    tsv lines are `name, type, description, command` separated by tabs (the
+    name first, for `fzf --with-nth` / `cut -f1`); json prints one object per
+    line, with the score and match positions. Every match is ranked before
+    the first is written, best first.
+    """
+    with profiler.phase("query", query=query):
+        response = _daemon_request({"op": "filter", "query": query, "limit": limit})
+        if response is not None:
+            matches = [_read_match(row) for row in response["matches"]]
+        else:
+            commands = parse_commands(zsh_file_path, harvest, ingest)
+            matches = SearchIndex(commands, postings=False, usage=UsageStore()).rank(
+                query, limit
+            )
+
+        write = sys.stdout.write
+        try:
+            for match in matches:
+                cmd = match.command
+                if output_format == "json":
+                    write(
+                        json.dumps(
+                            dict(
+                                asdict(cmd),
+                                score=match.score,
+                                name_positions=match.name_positions,
+                                description_positions=match.description_positions,
+                            )
+                        )
+                        + "\n"
+                    )
+                else:
+                    write(
+                        "\t".join(
+                            _tsv_field(field)
+                            for field in (
+                                cmd.name,
+                                cmd.command_type,
+                                cmd.description,
+                                cmd.raw_command,
+                            )
+                        )
+                        + "\n"
+                    )
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader (e.g. `head`) went away; that's fine
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "command_file",
+        nargs="?",
+        help="file to write the chosen command to (used by `l` before --handoff-fd)",
+    )
+    parser.add_argument(
+        "--handoff-fd",
+        type=int,
+        metavar="FD",
+        help="write the chosen command's type, name, command line and cwd, "
+        "NUL-separated, to inherited file descriptor FD (used by the `l` function)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=Path,
+        const=Profiler.DEFAULT_PATH,
+        metavar="PATH",
+        help="append phase and keystroke timings as JSON lines "
+        f"(default: {Profiler.DEFAULT_PATH}; or set LAUNCHER_PROFILE)",
+    )
+    parser.add_argument(
+        "--query",
+        metavar="TEXT",
+        help="print matching commands to stdout instead of showing the UI "
+        "('' lists everything)",
+    )
+    parser.add_argument(
+        "--limit", type=int, metavar="N", help="with --query, print at most N results"
+    )
+    parser.add_argument(
+        "--format",
+        choices=("tsv", "json"),
+        default="tsv",
+        help="with --query: tab-separated name/type/description/command, "
+        "or one JSON object per line (default: tsv)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run a resident server that keeps the commands warm for `l` "
+        f"(socket: {default_socket_path()})",
+    )
+    parser.add_argument(
+        "--harvest",
+        action="store_true",
+        default=bool(os.environ.get("LAUNCHER_HARVEST")),
+        help="also list aliases and functions a real zsh defines after sourcing "
+        "the config, from a harvest refreshed in the background "
+        "(or set LAUNCHER_HARVEST=1)",
+    )
+    parser.add_argument(
+        "--ingest",
+        action="append",
+        metavar="DIR_OR_GLOB",
+        default=[p for p in os.environ.get("LAUNCHER_INGEST", "").split(":") if p],
+        help="also list functions and aliases from every zsh file under a directory "
+        "(e.g. an fpath or plugin directory) or matching a glob; repeatable, "
+        "earlier ones win (or set LAUNCHER_INGEST=dir:glob:...)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="processes for --ingest (default: one per core)",
+    )
+    parser.add_argument(
+        "--harvest-now",
+        action="store_true",
+        help=f"run zsh on the config, save its aliases and functions to "
+        f"{RuntimeHarvest.DEFAULT_PATH} and exit",
+    )
+    return parser.parse_args(argv)
+
+
 def main():
     """Main entry point."""
     # Get the path to common.zsh
@@ -492,24 +2732,53 @@ def main():
         print(f"Error: {zsh_file} not found")
         sys.exit(1)
 
+    args = parse_args()
+    if args.profile is not None:
+        profiler.path = args.profile
+
+    harvest = RuntimeHarvest(str(zsh_file)) if args.harvest else None
+    ingest = BulkIngest(args.ingest, args.workers) if args.ingest else None
     try:
-        # Parse the zsh file
-        parser = ZshParser(str(zsh_file))
-        commands = parser.parse()
+        if args.harvest_now:
+            commands = RuntimeHarvest(str(zsh_file)).refresh()
+            print(f"Harvested {len(commands)} aliases and functions", file=sys.stderr)
+            return
+        if args.serve:
+            LauncherServer(
+                str(zsh_file), default_socket_path(), harvest, ingest
+            ).serve_forever()
+            return
+        if args.query is not None:
+            sys.exit(
+                run_query(
+                    str(zsh_file), args.query, args.limit, args.format, harvest, ingest
+                )
+            )
 
-        if not commands:
-            print("No commands found in zsh file")
-            sys.exit(1)
+        with profiler.phase("daemon_connect"):
+            server = ServerIndex.connect(lambda: parse_commands(str(zsh_file), harvest, ingest))
+        if server is not None:
+            # The server ranks; it merges its own harvest and ingest, if
+            # it was started with them
+            launcher = Launcher([], str(zsh_file), server=server)
+        else:
+            commands = parse_commands(str(zsh_file), harvest, ingest)
+            if not commands:
+                print("No commands found in zsh file")
+                sys.exit(1)
+            launcher = Launcher(commands, str(zsh_file), harvest, ingest)
 
         # Create and run launcher
-        launcher = Launcher(commands, str(zsh_file))
-        # Check if a command file argument was provided
-        command_file = sys.argv[1] if len(sys.argv) > 1 else None
-        launcher.run(command_file)
+        launcher.run(args.command_file, args.handoff_fd)
 
+    except subprocess.SubprocessError as e:
+        print(f"Error: harvest failed: {e}")
+        sys.exit(1)
     except (FileNotFoundError, OSError, ValueError) as e:
         print(f"Error: {e}")
         sys.exit(1)
+    finally:
+        profiler.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,475 @@
+"""
+Textual UI for launcher.py.
+
+Kept in its own module so launcher.py only imports textual once it is about
+to show the UI; headless paths never pay for it.
+"""
+
+import shlex
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, Tuple
+
+try:
+    from textual import work  # pyright: ignore[reportMissingImports]
+    from textual.app import App, ComposeResult  # pyright: ignore[reportMissingImports]
+    from textual.containers import Container, Horizontal  # pyright: ignore[reportMissingImports]
+    from textual.message import Message  # pyright: ignore[reportMissingImports]
+    from textual.widgets import Header, Footer, Input, Static  # pyright: ignore[reportMissingImports] # pylint: disable=line-too-long
+    from textual.binding import Binding  # pyright: ignore[reportMissingImports]
+    from textual.cache import LRUCache  # pyright: ignore[reportMissingImports]
+    from textual.geometry import Region, Size  # pyright: ignore[reportMissingImports]
+    from textual.scroll_view import ScrollView  # pyright: ignore[reportMissingImports]
+    from textual.strip import Strip  # pyright: ignore[reportMissingImports]
+    from textual.timer import Timer  # pyright: ignore[reportMissingImports]
+    from textual.worker import get_current_worker  # pyright: ignore[reportMissingImports]
+    from rich.syntax import Syntax  # pyright: ignore[reportMissingImports]
+    from rich.text import Text  # pyright: ignore[reportMissingImports]
+except ImportError:
+    print("Error: textual library not found. Install with: pip install textual")
+    sys.exit(1)
+
+if TYPE_CHECKING:
+    from launcher import Command, Match, Profiler
+
+MATCH_STYLE = "bold underline"
+# Wait this long after a keystroke before searching, so a burst of typing
+# runs one search instead of one per key
+DEBOUNCE_SECONDS = 0.03
+
+
+def match_label(match: "Match") -> Text:
+    """`name - description` with the matched characters highlighted."""
+    command = match.command
+    label = Text(command.name)
+    for position in match.name_positions:
+        label.stylize(MATCH_STYLE, position, position + 1)
+    label.append(" - ")
+    offset = len(label)
+    label.append(command.description or "No description")
+    if command.description:
+        for position in match.description_positions:
+            label.stylize(MATCH_STYLE, offset + position, offset + position + 1)
+    return label
+
+
+def _row_key(match: "Match") -> tuple:
+    # What match_label draws; id(command) can be reused once commands are replaced
+    command = match.command
+    return command.name, command.description, match.name_positions, match.description_positions
+
+
+class CommandList(ScrollView, can_focus=True, inherit_bindings=False):
+    """A virtual list of matches: one row per match, no widget per row.
+
+    Rows are drawn on demand for the lines in view, so a list of 100k
+    matches costs the same to show and scroll as a list of 20. Rendered
+    rows are cached by command and highlight, and a new result set only
+    repaints the visible lines whose row actually changed.
+    """
+
+    COMPONENT_CLASSES = {"command-list--cursor"}
+
+    class Highlighted(Message):
+        """The command under the cursor (or the first match) changed."""
+
+        def __init__(self, command: Optional["Command"]):
+            self.command = command
+            super().__init__()
+
+    DEFAULT_CSS = """
+    CommandList {
+        height: 1fr;
+    }
+    CommandList > .command-list--cursor {
+        background: $accent;
+    }
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.matches: Sequence["Match"] = ()
+        self.index: Optional[int] = None
+        self._rows: LRUCache = LRUCache(512)
+
+    def set_matches(self, matches: Sequence["Match"]) -> None:
+        """Show matches, repainting only the visible rows that differ."""
+        previous, self.matches = self.matches, matches
+        # Don't auto-select the first item to prevent automatic execution
+        self.index = None
+        if len(previous) != len(matches):
+            self.virtual_size = Size(self.size.width, len(matches))
+        if self.scroll_offset.y:
+            # A new result set starts at its best match
+            self.scroll_to(y=0, animate=False)
+            self.refresh()
+        top = self.scroll_offset.y
+        for y in range(top, min(top + self.size.height, max(len(previous), len(matches)))):
+            if (
+                y >= len(previous)
+                or y >= len(matches)
+                or _row_key(previous[y]) != _row_key(matches[y])
+            ):
+                self.refresh_line(y)
+        self.post_message(self.Highlighted(matches[0].command if matches else None))
+
+    def move_cursor(self, index: int) -> None:
+        """Select the row at index and scroll it into view."""
+        if not self.matches:
+            return
+        previous, self.index = self.index, max(0, min(index, len(self.matches) - 1))
+        if previous is not None:
+            self.refresh_line(previous)
+        self.refresh_line(self.index)
+        self.scroll_to_region(Region(0, self.index, 1, 1), animate=False)
+        if previous != self.index:
+            self.post_message(self.Highlighted(self.matches[self.index].command))
+
+    def selected_command(self) -> Optional["Command"]:
+        """The command under the cursor, else the first match, if any."""
+        index = self.index or 0
+        if index >= len(self.matches):
+            return None
+        return self.matches[index].command
+
+    def on_resize(self) -> None:
+        """Keep the virtual width in step with the widget."""
+        self.virtual_size = Size(self.size.width, len(self.matches))
+
+    def on_click(self, event) -> None:
+        """Move the cursor to the clicked row; Enter runs it."""
+        self.move_cursor(event.y + self.scroll_offset.y)
+
+    def render_line(self, y: int) -> Strip:
+        """Draw one line of the viewport."""
+        row = y + self.scroll_offset.y
+        width = self.size.width
+        if row >= len(self.matches):
+            return Strip.blank(width, self.rich_style)
+        match = self.matches[row]
+        selected = row == self.index
+        key = (_row_key(match), selected, width)
+        strip = self._rows.get(key)
+        if strip is None:
+            style = (
+                self.get_component_rich_style("command-list--cursor")
+                if selected
+                else self.rich_style
+            )
+            label = match_label(match)
+            label.no_wrap = True
+            label.truncate(width)
+            strip = Strip(label.render(self.app.console, end=""))
+            strip = strip.apply_style(style).extend_cell_length(width, style).crop(0, width)
+            self._rows[key] = strip
+        return strip
+
+
+class CommandPreview(Static):
+    """The highlighted command's definition: a function's body, read from
+    its source on demand, or an alias's value."""
+
+    DEFAULT_CSS = """
+    CommandPreview {
+        width: 1fr;
+        height: 1fr;
+        border: round $primary;
+        overflow-y: auto;
+    }
+    """
+
+    def __init__(self, body: Callable[["Command"], Optional[Tuple[str, int]]], **kwargs):
+        super().__init__(**kwargs)
+        self.body = body
+
+    def show(self, command: Optional["Command"]) -> None:
+        """Preview command, or clear the pane for None."""
+        self.border_subtitle = None
+        if command is None:
+            self.border_title = None
+            self.update("")
+            return
+        if command.command_type == "alias":
+            self.border_title = f"alias {command.name}"
+            # Quoted the way a shell reads it back, not as a Python repr
+            definition = f"alias {command.name}={shlex.quote(command.raw_command)}"
+            self.update(Syntax(definition, "zsh"))
+            return
+        body = self.body(command)
+        self.border_title = f"{command.name}()"
+        if body is None:
+            self.update(Text("No preview available", style="dim"))
+            return
+        text, line = body
+        self.border_subtitle = f"{command.source}:{line}"
+        self.update(Syntax(text, "zsh", word_wrap=True))
+
+
+class LauncherApp(App):
+    """Interactive TUI launcher for commands using Textual."""
+
+    BINDINGS = [
+        Binding("q", "quit", "Quit"),
+        Binding("escape", "quit", "Quit"),
+        Binding("ctrl+j", "focus_list", "Focus List"),
+        Binding("ctrl+k", "focus_search", "Focus Search"),
+        Binding("ctrl+t", "toggle_preview", "Preview"),
+    ]
+
+    CSS = """
+    #results {
+        height: 1fr;
+    }
+    #command_list {
+        width: 1fr;
+    }
+    """
+
+    def __init__(
+        self,
+        commands: List["Command"],
+        zsh_file_path: str,
+        rank: Callable[..., Sequence["Match"]],
+        profiler: "Profiler",
+        body: Callable[["Command"], Optional[Tuple[str, int]]] = lambda command: None,
+    ):
+        super().__init__()
+        self.commands = commands
+        self.zsh_file_path = zsh_file_path
+        self.rank = rank
+        self.profiler = profiler
+        self.body = body
+        self.matches = rank("")
+        # The query the list currently shows, and the latest one typed
+        self.shown_query = ""
+        self.typed_query = ""
+        self._search_timer: Optional[Timer] = None
+        # The command picked with Enter, for the launcher to record
+        self.selected_command: Optional["Command"] = None
+
+    def compose(self) -> ComposeResult:
+        """Create child widgets for the app."""
+        with self.profiler.phase("compose"):
+            yield Header()
+            yield Container(
+                Input(placeholder="Search commands...", id="search"),
+                Horizontal(
+                    CommandList(id="command_list"),
+                    CommandPreview(self.body, id="preview"),
+                    id="results",
+                ),
+                id="main",
+            )
+            yield Footer()
+
+    def on_mount(self) -> None:
+        """Called when app starts."""
+        with self.profiler.phase("mount", commands=len(self.commands)):
+            self._populate_list()
+            # Focus the search input so user can immediately type
+            search_input = self.query_one("#search", Input)
+            search_input.focus()
+        if self.profiler.enabled:
+            self.call_after_refresh(
+                lambda: self.profiler.record(
+                    "first_paint", ms=round(self.profiler.since_start(), 3)
+                )
+            )
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        """Called when the search input changes."""
+        if event.input.id == "search":
+            self.typed_query = event.value
+            if self._search_timer is not None:
+                self._search_timer.stop()
+            self._search_timer = self.set_timer(
+                DEBOUNCE_SECONDS, lambda: self._search(event.value, time.perf_counter())
+            )
+
+    def on_key(self, event) -> None:
+        """Handle global key events."""
+        # Handle arrow keys globally
+        if event.key == "up":
+            self.action_move_up()
+        elif event.key == "down":
+            self.action_move_down()
+        elif event.key == "enter":
+            # If we're in the search input, execute the first command
+            if isinstance(self.focused, Input):
+                self.action_execute_first()
+            else:
+                # Otherwise execute the currently selected item
+                self.action_select_item()
+
+    def action_move_up(self) -> None:
+        """Move selection up."""
+        command_list = self.query_one("#command_list", CommandList)
+        current_index = command_list.index or 0
+        if current_index > 0:
+            command_list.move_cursor(current_index - 1)
+
+    def action_move_down(self) -> None:
+        """Move selection down."""
+        command_list = self.query_one("#command_list", CommandList)
+        if command_list.index is None:
+            command_list.move_cursor(0)
+        else:
+            command_list.move_cursor(command_list.index + 1)
+
+    def action_select_item(self) -> None:
+        """Select the current item."""
+        command_list = self.query_one("#command_list", CommandList)
+        command = command_list.selected_command()
+        if command is not None:
+            self._execute_command(command)
+
+    def action_focus_list(self) -> None:
+        """Focus the list view."""
+        command_list = self.query_one("#command_list", CommandList)
+        command_list.focus()
+
+    def on_command_list_highlighted(self, event: CommandList.Highlighted) -> None:
+        """Preview the highlighted command."""
+        preview = self.query_one("#preview", CommandPreview)
+        if preview.display:
+            preview.show(event.command)
+
+    def action_toggle_preview(self) -> None:
+        """Show or hide the preview pane."""
+        preview = self.query_one("#preview", CommandPreview)
+        preview.display = not preview.display
+        if preview.display:
+            preview.show(self.query_one("#command_list", CommandList).selected_command())
+
+    def replace_commands(self, commands: List["Command"], rank: Callable[..., Sequence["Match"]]):
+        """Swap in a new command set (e.g. a finished harvest) and redo the search."""
+        self.commands = commands
+        self.rank = rank
+        self._search(self.typed_query, time.perf_counter())
+
+    def action_focus_search(self) -> None:
+        """Focus the search input."""
+        search_input = self.query_one("#search", Input)
+        search_input.focus()
+
+    def action_execute_first(self) -> None:
+        """Execute the first command in the filtered list."""
+        if self.shown_query != self.typed_query:
+            # Enter beat the search for what's typed; rank it here
+            self._filter_commands(self.typed_query)
+        if self.matches:
+            first_command = self.matches[0].command
+            self._execute_command(first_command)
+
+    def _record_keystroke(self, query: str, started: float, filtered: float, rendered: float):
+        """Record filter, list-rebuild and time-to-paint for one keystroke."""
+        painted = time.perf_counter()
+        self.profiler.record(
+            "keystroke",
+            query=query,
+            results=len(self.matches),
+            filter_ms=round((filtered - started) * 1000, 3),
+            render_ms=round((rendered - filtered) * 1000, 3),
+            paint_ms=round((painted - started) * 1000, 3),
+        )
+
+    def _populate_list(self):
+        """Populate the list with commands."""
+        self.query_one("#command_list", CommandList).set_matches(self.matches)
+
+    @work(thread=True, exclusive=True, group="search")
+    def _search(self, query: str, started: float):
+        """Rank query off the event loop; a newer search cancels this one."""
+        worker = get_current_worker()
+        try:
+            matches = self.rank(query, cancelled=lambda: worker.is_cancelled)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # launcher.SearchCancelled; the class isn't importable from here
+            # when launcher.py runs as __main__
+            if worker.is_cancelled:
+                return
+            raise
+        if not worker.is_cancelled:
+            self.call_from_thread(
+                self._show_matches, query, matches, started, time.perf_counter()
+            )
+
+    def _show_matches(
+        self, query: str, matches: Sequence["Match"], started: float, filtered: float
+    ):
+        """Show a finished search, unless a newer query has been typed since."""
+        if query != self.typed_query:
+            return
+        self.matches = matches
+        self.shown_query = query
+        self._populate_list()
+        if self.profiler.enabled:
+            self.call_after_refresh(
+                self._record_keystroke, query, started, filtered, time.perf_counter()
+            )
+
+    def _filter_commands(self, query: str):
+        """Filter commands based on query, best matches first."""
+        started = time.perf_counter()
+        self._show_matches(query, self.rank(query), started, time.perf_counter())
+
+    def _execute_command(self, command: "Command"):
+        """Show a fake terminal with the command."""
+        print(f"DEBUG: Executing command: {command.name} = {command.raw_command}")
+        self.selected_command = command
+        # Store the command to show in fake terminal
+        self._command_to_execute = ( # pylint: disable=attribute-defined-outside-init
+            command.raw_command
+        )
+
+        # Exit the launcher
+        self.exit()
+
+
+class FakeTerminalApp(App):
+    """A fake terminal app that shows an editable command."""
+
+    BINDINGS = [
+        Binding("ctrl+c", "quit", "Cancel"),
+        Binding("escape", "quit", "Cancel"),
+    ]
+
+    def __init__(self, initial_command: str, zsh_file_path: str):
+        super().__init__()
+        self.initial_command = initial_command
+        self.zsh_file_path = zsh_file_path
+
+    def compose(self) -> ComposeResult:
+        """Create the fake terminal interface."""
+        yield Header()
+        yield Container(
+            Static("Command-", id="prompt"),
+            Input(value=self.initial_command, id="command_input"),
+            Static("Enter to execute", id="instructions"),
+            id="terminal",
+        )
+        yield Footer()
+
+    def on_mount(self) -> None:
+        """Called when the fake terminal starts."""
+        # Focus the input field
+        input_field = self.query_one("#command_input", Input)
+        input_field.focus()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        """Called when Enter is pressed in the input field."""
+        if event.input.id == "command_input":
+            self._execute_command(event.value)
+
+    def _execute_command(self, command: str):
+        """Execute the command and exit."""
+        # Store the command to execute after the app exits
+        self._command_to_execute = ( # pylint: disable=attribute-defined-outside-init
+            command
+        )
+        self._zsh_file = ( # pylint: disable=attribute-defined-outside-init
+            self.zsh_file_path
+        )
+
+        # Exit the fake terminal
+        self.exit()
@@ -4,17 +4,36 @@ Apply stow configuration and sync BetterTouchTool settings.
 
 This script manages dotfiles using GNU stow, handles conflicts by moving
 them to a backup directory, and syncs BetterTouchTool settings bidirectionally.
+
+Conflicts are found up front by plan_stow, which walks the package the way
+stow would, so they are all moved aside in one batch before a single stow.
+The steps run concurrently where they don't depend on each other (see
+run_steps), ending with a summary of each step's time and status.
 """
 import subprocess
 import re
 import os
+import io
+import sys
+import argparse
+import json
+import time
 import shutil
+import fnmatch
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 # Config
 HOME = Path.home()
 DOTFILES = HOME / "git" / "dotfiles"
 BACKUP_DIR = HOME / "dotfiles-backup"
+# Manifests of synced trees (see Manifest)
+CACHE_DIR = HOME / ".cache" / "dotfiles"
 
 # Find stow in common locations (needed for cron jobs with limited PATH)
 STOW_PATHS = [
@@ -39,16 +58,21 @@ def get_stow_path():
 
 
 STOW_EXECUTABLE = get_stow_path()
+# Passed to stow as --ignore, and applied the same way by plan_stow
+STOW_IGNORES = [
+    "^\\.git(ignore|config)?$",
+    "BetterTouchTool",
+]
 STOW_CMD = [
     STOW_EXECUTABLE if STOW_EXECUTABLE else "stow",
     "-v",
     "--dotfiles",
     f"--target={HOME}",
     "--restow",
-    "--ignore=^\\.git(ignore|config)?$",
-    "--ignore=BetterTouchTool",
+    *(f"--ignore={regex}" for regex in STOW_IGNORES),
     ".",
 ]
+LOCAL_IGNORE_FILE = ".stow-local-ignore"
 
 # Ensure backup directory exists
 BACKUP_DIR.mkdir(exist_ok=True)
@@ -60,9 +84,9 @@ def check_stow_available():
 
 
 def run_stow():
-    """Run stow and return its stdout+stderr text."""
+    """Run stow; return the finished process (output in stdout), or None."""
     try:
-        result = subprocess.run(
+        return subprocess.run(
             STOW_CMD,
             cwd=DOTFILES,
             text=True,
@@ -70,46 +94,567 @@ def run_stow():
             stderr=subprocess.STDOUT,
             check=False,
         )
-        return result.stdout
     except FileNotFoundError:
         return None
 
 
-def parse_conflicts(output):
-    """Extract conflicted file paths from stow output."""
-    pattern = re.compile(r"over existing target ([^ ]+)")
-    return pattern.findall(output)
+@dataclass
+class StowPlan:
+    """What stowing the package would do, worked out without touching anything.
+
+    Paths are relative to the target directory.
+    """
 
+    # (target, source) symlinks to create; a directory missing from the
+    # target is linked whole, as stow folds it
+    links: List[Tuple[str, Path]] = field(default_factory=list)
+    # Files (or directories where the package has a file) in the way;
+    # stow refuses these, so they are moved aside first
+    conflicts: List[str] = field(default_factory=list)
+    # Symlinks in the way that point outside the package; stow won't touch
+    # them and neither do we
+    foreign: List[str] = field(default_factory=list)
 
-def move_conflicts(conflicts):
-    """Move conflicting files to backup dir, preserving relative paths."""
-    moved = []
-    for rel_path in conflicts:
-        src = HOME / rel_path
-        dest = BACKUP_DIR / rel_path
-        if src.exists():
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            src.rename(dest)
+
+def read_local_ignores(package):
+    """Regexes from the package's .stow-local-ignore, as stow reads them."""
+    regexes = []
+    try:
+        lines = (package / LOCAL_IGNORE_FILE).read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return regexes
+    for line in lines:
+        line = re.sub(r"(?<!\\)#.*", "", line).replace("\\#", "#").strip()
+        if line:
+            regexes.append(line)
+    return regexes
+
+
+def make_ignore_check(local_ignores, cli_ignores):
+    """A predicate for package-relative paths, matching stow's rules.
+
+    --ignore regexes match the end of the path. Local ignores match the
+    whole path (with a leading /) if they contain a /, else the whole
+    basename.
+    """
+    cli = [re.compile(f"(?:{regex})\\Z") for regex in cli_ignores]
+    by_path = [f"(?:{regex})" for regex in local_ignores if "/" in regex]
+    by_name = [f"(?:{regex})" for regex in local_ignores if "/" not in regex]
+    path_regex = re.compile("^/(?:" + "|".join(by_path) + ")$") if by_path else None
+    name_regex = re.compile("^(?:" + "|".join(by_name) + ")$") if by_name else None
+
+    def ignored(rel_path):
+        if rel_path == LOCAL_IGNORE_FILE:
+            return True
+        if any(regex.search(rel_path) for regex in cli):
+            return True
+        if path_regex is not None and path_regex.match("/" + rel_path):
+            return True
+        name = rel_path.rsplit("/", 1)[-1]
+        return name_regex is not None and name_regex.match(name) is not None
+
+    return ignored
+
+
+def _dotfile_name(name):
+    """stow --dotfiles: dot-foo in the package is .foo in the target."""
+    return "." + name[4:] if name.startswith("dot-") and len(name) > 4 else name
+
+
+def _owned_by_package(link, package):
+    """Whether a symlink points into the package (so stow owns it)."""
+    destination = os.path.normpath(os.path.join(os.path.dirname(link), os.readlink(link)))
+    return destination == str(package) or destination.startswith(str(package) + os.sep)
+
+
+def plan_stow(package=DOTFILES, target=HOME, cli_ignores=None):
+    """Walk the package once and work out every link and conflict.
+
+    Mirrors `stow --dotfiles --restow`: a package directory whose target
+    doesn't exist becomes one link, a real target directory is descended
+    into, a link already pointing into the package is left for the restow
+    to refresh, a link pointing elsewhere is foreign, and anything else in
+    the way is a conflict.
+    """
+    package, target = Path(package).resolve(), Path(target)
+    ignored = make_ignore_check(
+        read_local_ignores(package), STOW_IGNORES if cli_ignores is None else cli_ignores
+    )
+    plan = StowPlan()
+
+    def walk(package_dir, rel_dir, target_rel_dir):
+        try:
+            entries = sorted(os.scandir(package_dir), key=lambda entry: entry.name)
+        except OSError:
+            return
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if ignored(rel_path):
+                continue
+            name = _dotfile_name(entry.name)
+            target_rel = f"{target_rel_dir}/{name}" if target_rel_dir else name
+            target_path = target / target_rel
+            source_is_dir = entry.is_dir(follow_symlinks=False)
+
+            if target_path.is_symlink():
+                if not _owned_by_package(target_path, package):
+                    plan.foreign.append(target_rel)
+            elif not os.path.lexists(target_path):
+                plan.links.append((target_rel, Path(entry.path)))
+            elif source_is_dir and target_path.is_dir():
+                walk(entry.path, rel_path, target_rel)
+            else:
+                plan.conflicts.append(target_rel)
+
+    walk(package, "", "")
+    return plan
+
+
+def link_natively(plan, target=HOME):
+    """Create the plan's links with relative paths, as stow would."""
+    linked = []
+    for target_rel, source in plan.links:
+        link = Path(target) / target_rel
+        if os.path.lexists(link):
+            continue  # appeared since planning; leave it for the next run
+        link.parent.mkdir(parents=True, exist_ok=True)
+        os.symlink(os.path.relpath(source, link.parent), link)
+        linked.append(target_rel)
+    return linked
+
+
+class BackupStore:
+    """Content-addressed store for files displaced by stow.
+
+    Each file's content goes to blobs/<sha256[:2]>/<sha256[2:]> once, no
+    matter how many runs (or hosts sharing the directory) back it up. Each
+    run writes runs/<run id>.json mapping the paths it moved, relative to
+    the home directory, to their blob, mode and mtime. A blob is
+    hard-linked from the original where possible and copied otherwise
+    (e.g. across filesystems). The run manifest is saved before any
+    original is removed.
+
+    Backups made before the store (plain files under ~/dotfiles-backup)
+    are left where they are.
+    """
+
+    # gc keeps the newest KEEP_RUNS runs and any run younger than KEEP_DAYS
+    KEEP_RUNS = 10
+    KEEP_DAYS = 90
+
+    def __init__(self, root=BACKUP_DIR):
+        self.root = Path(root)
+        self.blobs = self.root / "blobs"
+        self.runs_dir = self.root / "runs"
+
+    def runs(self) -> List[Path]:
+        """Run manifests, oldest first."""
+
+        def created(run):
+            try:
+                return self.load_run(run)["created"]
+            except (OSError, ValueError, KeyError):
+                return run.stat().st_mtime
+
+        return sorted(self.runs_dir.glob("*.json"), key=lambda run: (created(run), run.name))
+
+    @staticmethod
+    def load_run(run: Path) -> dict:
+        with open(run, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _blob_path(self, digest) -> Path:
+        return self.blobs / digest[:2] / digest[2:]
+
+    def _store(self, path) -> dict:
+        """Put one file's content in the store; return its manifest record."""
+        if os.path.islink(path):
+            return {"symlink": os.readlink(path)}
+        stat = os.lstat(path)
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        blob = self._blob_path(digest.hexdigest())
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            if stat.st_nlink > 1:
+                # Another name for this inode stays in use; an edit through
+                # it would change the blob under its digest
+                copy_file(Path(path), blob)
+            else:
+                try:
+                    os.link(path, blob)
+                except FileExistsError:
+                    pass
+                except OSError:  # another filesystem, or no hard links
+                    copy_file(Path(path), blob)
+        return {
+            "blob": digest.hexdigest(),
+            "size": stat.st_size,
+            "mode": stat.st_mode & 0o7777,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def _store_tree(self, src, home) -> Optional[Dict[str, dict]]:
+        """Records for src and, for a directory, everything under it
+        (symlinks to directories and empty directories included); None if
+        something in it can't be recorded, so it must not be removed."""
+        rel_path = str(src.relative_to(home))
+        if not src.is_dir() or src.is_symlink():
+            if not (src.is_symlink() or src.is_file()):
+                return None
+            return {rel_path: self._store(src)}
+        records = {}
+        for root, dirs, names in os.walk(src):
+            root = Path(root)
+            if not dirs and not names:
+                records[str(root.relative_to(home))] = {
+                    "directory": True,
+                    "mode": os.lstat(root).st_mode & 0o7777,
+                }
+            # os.walk lists symlinks to directories in dirs without following them
+            for name in [*names, *(d for d in dirs if (root / d).is_symlink())]:
+                path = root / name
+                if not (path.is_symlink() or path.is_file()):
+                    return None
+                records[str(path.relative_to(home))] = self._store(path)
+        return records
+
+    def backup(self, home, rel_paths) -> List[str]:
+        """Move rel_paths (files or directories under home) into the store
+        as one run; return the paths moved."""
+        files: Dict[str, dict] = {}
+        moved = []
+        for rel_path in rel_paths:
+            src = Path(home) / rel_path
+            if not os.path.lexists(src):
+                continue
+            records = self._store_tree(src, home)
+            if records is None:
+                print(
+                    f"✗ {rel_path} holds something other than files, links and "
+                    "directories; leaving it in place"
+                )
+                continue
+            files.update(records)
             moved.append(rel_path)
-    return moved
+        if not moved:
+            return moved
 
+        run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.uname().nodename}"
+        run = self.runs_dir / f"{run_id}.json"
+        suffix = 1
+        while run.exists():
+            suffix += 1
+            run = self.runs_dir / f"{run_id}-{suffix}.json"
+        _write_json(run, {"created": time.time(), "host": os.uname().nodename, "files": files})
 
-def get_newest_mtime(directory):
-    """Get the newest modification time from files in a directory."""
-    if not directory.exists():
-        return 0
+        for rel_path in moved:
+            src = Path(home) / rel_path
+            if src.is_dir() and not src.is_symlink():
+                shutil.rmtree(src)
+            else:
+                src.unlink()
+        return moved
 
-    newest = 0
-    for root, _, files in os.walk(directory):
-        for file in files:
-            filepath = Path(root) / file
+    def restore(self, paths=None, run=None, target=HOME, force=False):
+        """Put backed-up files back under target.
+
+        Each path comes from the named run, or the latest run holding it;
+        with no paths, every file in the run. A stow symlink in the way is
+        replaced; a real file only with force. Nothing is written through a
+        directory that links into the dotfiles. Returns (restored, skipped
+        with reasons).
+        """
+        runs = [self.runs_dir / f"{run}.json"] if run else list(reversed(self.runs()))
+        records: Dict[str, dict] = {}
+        for run_path in runs:
+            for path, record in self.load_run(run_path)["files"].items():
+                records.setdefault(path, record)
+        if paths:
+            wanted = {}
+            for path in paths:
+                prefix = path.rstrip("/") + "/"
+                matches = {p: r for p, r in records.items() if p == path or p.startswith(prefix)}
+                wanted.update(matches or {path: None})
+            records = wanted
+
+        restored, skipped = [], []
+        dotfiles = DOTFILES.resolve()
+        for path, record in sorted(records.items()):
+            dest = Path(target) / path
+            if record is None:
+                skipped.append((path, "not in any backup run"))
+                continue
+            if dotfiles in dest.parent.resolve().parents or dest.parent.resolve() == dotfiles:
+                skipped.append((path, "its directory is a link into the dotfiles"))
+                continue
+            if "directory" in record and dest.is_dir() and not dest.is_symlink():
+                restored.append(path)
+                continue
+            if os.path.lexists(dest) and not dest.is_symlink() and not force:
+                skipped.append((path, "a file is in the way (use --force)"))
+                continue
+            if dest.is_symlink() or (force and dest.is_file()):
+                dest.unlink()
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if "symlink" in record:
+                os.symlink(record["symlink"], dest)
+            elif "directory" in record:
+                dest.mkdir(mode=record["mode"])
+            else:
+                copy_file(self._blob_path(record["blob"]), dest)
+                os.chmod(dest, record["mode"])
+                os.utime(dest, ns=(record["mtime_ns"], record["mtime_ns"]))
+            restored.append(path)
+        return restored, skipped
+
+    def gc(self, keep_runs=KEEP_RUNS, keep_days=KEEP_DAYS):
+        """Drop runs past the retention policy, then blobs no run uses.
+
+        Returns (runs removed, blobs removed, bytes freed).
+        """
+        runs = self.runs()
+        cutoff = time.time() - keep_days * 86400
+        removed_runs = []
+        for run in runs[: max(0, len(runs) - keep_runs)]:
+            try:
+                created = self.load_run(run)["created"]
+            except (OSError, ValueError, KeyError):
+                created = run.stat().st_mtime
+            if created < cutoff:
+                run.unlink()
+                removed_runs.append(run.stem)
+
+        used = set()
+        for run in self.runs():
+            for record in self.load_run(run)["files"].values():
+                if "blob" in record:
+                    used.add(record["blob"])
+        removed_blobs, freed = 0, 0
+        for fanout in self.blobs.glob("*") if self.blobs.exists() else ():
+            for blob in fanout.iterdir():
+                if fanout.name + blob.name not in used:
+                    freed += blob.lstat().st_size
+                    blob.unlink()
+                    removed_blobs += 1
+            try:
+                fanout.rmdir()
+            except OSError:
+                pass  # still holds blobs
+        return removed_runs, removed_blobs, freed
+
+
+def _write_json(path, data):
+    """Write JSON atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        os.unlink(tmp)
+        raise
+
+
+def move_conflicts(conflicts):
+    """Move conflicting files into the backup store as one run."""
+    return BackupStore().backup(HOME, conflicts)
+
+
+class FileState(NamedTuple):
+    """What the manifest knows about one file."""
+
+    size: int
+    mtime_ns: int
+    inode: int
+    sha1: Optional[str] = None
+
+
+@dataclass
+class ManifestDiff:
+    """Files added, removed and modified since the last scan (relative paths)."""
+
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def lines(self):
+        """One `+ path`, `- path` or `~ path` line per changed file."""
+        return sorted(
+            [f"+ {path}" for path in self.added]
+            + [f"- {path}" for path in self.removed]
+            + [f"~ {path}" for path in self.modified],
+            key=lambda line: line[2:],
+        )
+
+
+class Manifest:
+    """A tree's files (path -> size, mtime, inode, optional hash), kept on disk.
+
+    Each directory's entries are saved with its mtime. A scan stats every
+    directory but only lists, and stats the files of, the ones whose mtime
+    changed; the rest keep their saved entries. So a mostly unchanged tree
+    costs a stat per directory rather than per file.
+
+    A file rewritten in place doesn't change its directory's mtime (saves
+    that write a new file and rename it over the old one do). Files whose
+    names match one of the ``restat`` patterns are known to be written that
+    way, so they are re-stat'ed on every scan; every FULL_SCAN_EVERY
+    seconds, or with scan(full=True), every file is.
+
+    With hash_files, each file's sha1 is kept too (recomputed only when its
+    stat changes), so a file touched without changing reads as unchanged.
+    """
+
+    VERSION = 1
+    FULL_SCAN_EVERY = 24 * 3600
+
+    def __init__(self, root, path, hash_files=False, restat=()):
+        self.root = Path(root)
+        self.path = Path(path)
+        self.hash_files = hash_files
+        self.restat = tuple(restat)
+        # Relative directory ("" for the root) -> its mtime, files and subdirectories
+        self.dirs: Dict[str, dict] = {}
+        self.full_scan_at = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data["version"] != self.VERSION or data["root"] != str(self.root):
+                return
+            for entry in data["dirs"].values():
+                entry["files"] = {
+                    name: FileState(*state) for name, state in entry["files"].items()
+                }
+            self.dirs = data["dirs"]
+            self.full_scan_at = data["full_scan_at"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # no usable manifest; the first scan lists everything
+
+    def save(self):
+        """Write the manifest atomically."""
+        data = {
+            "version": self.VERSION,
+            "root": str(self.root),
+            "full_scan_at": self.full_scan_at,
+            "dirs": {
+                rel: dict(
+                    entry, files={name: list(state) for name, state in entry["files"].items()}
+                )
+                for rel, entry in self.dirs.items()
+            },
+        }
+        _write_json(self.path, data)
+
+    @property
+    def files(self) -> Dict[str, FileState]:
+        """Every file, by path relative to the root."""
+        return {
+            f"{rel}/{name}" if rel else name: state
+            for rel, entry in self.dirs.items()
+            for name, state in entry["files"].items()
+        }
+
+    def scan(self, full=None) -> ManifestDiff:
+        """Bring the manifest up to date; return what changed since the last scan."""
+        if full is None:
+            full = time.time() - self.full_scan_at > self.FULL_SCAN_EVERY
+        before = self.files
+        dirs: Dict[str, dict] = {}
+        pending = [""]
+        while pending:
+            rel = pending.pop()
+            directory = self.root / rel if rel else self.root
             try:
-                mtime = filepath.stat().st_mtime
-                if mtime > newest:
-                    newest = mtime
-            except (OSError, FileNotFoundError):
-                pass
-    return newest
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            entry = self.dirs.get(rel)
+            if full or entry is None or entry["mtime"] != mtime_ns:
+                entry = self._list(directory, rel, mtime_ns, before)
+            elif self.restat:
+                entry = self._restat(directory, rel, entry, before)
+            dirs[rel] = entry
+            pending.extend(f"{rel}/{name}" if rel else name for name in entry["subdirs"])
+        self.dirs = dirs
+        if full:
+            self.full_scan_at = time.time()
+
+        after = self.files
+        diff = ManifestDiff()
+        for path, state in after.items():
+            if path not in before:
+                diff.added.append(path)
+            elif state != before[path]:
+                diff.modified.append(path)
+        diff.removed = [path for path in before if path not in after]
+        return diff
+
+    def _restat(self, directory, rel, entry, before) -> dict:
+        """Re-stat the files of an unchanged directory that match restat."""
+        files = dict(entry["files"])
+        for name in files:
+            if not any(fnmatch.fnmatchcase(name, pattern) for pattern in self.restat):
+                continue
+            try:
+                stat = os.stat(directory / name, follow_symlinks=False)
+            except OSError:
+                continue  # removed, which changes the directory's mtime
+            rel_path = f"{rel}/{name}" if rel else name
+            files[name] = self._state(directory / name, stat, rel_path, before)
+        return dict(entry, files=files)
+
+    def _state(self, path, stat, rel_path, before) -> FileState:
+        """A file's state, hashing it only if its stat changed."""
+        state = FileState(stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        if self.hash_files:
+            previous = before.get(rel_path)
+            if previous is not None and previous[:3] == state[:3]:
+                return previous
+            state = state._replace(sha1=_sha1(path))
+        return state
+
+    def _list(self, directory, rel, mtime_ns, before) -> dict:
+        """Scan one directory, hashing only files whose stat changed."""
+        files, subdirs = {}, []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            entries = []
+        for dir_entry in entries:
+            try:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    subdirs.append(dir_entry.name)
+                    continue
+                if not dir_entry.is_file(follow_symlinks=False):
+                    continue
+                stat = dir_entry.stat(follow_symlinks=False)
+            except OSError:
+                continue  # removed while listing
+            files[dir_entry.name] = self._state(
+                dir_entry.path, stat, f"{rel}/{dir_entry.name}" if rel else dir_entry.name, before
+            )
+        return {"mtime": mtime_ns, "files": files, "subdirs": sorted(subdirs)}
+
+
+def _sha1(path) -> Optional[str]:
+    digest = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
 
 
 def configure_iterm2():
@@ -162,8 +707,239 @@ def configure_iterm2():
         return False
 
 
-def sync_bettertouchtool():
-    """Bidirectionally sync BetterTouchTool settings based on which is newer."""
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size} B"
+
+
+def _clone(src, dst):
+    """Clone src to a new file dst (reflink/clonefile); False if unsupported."""
+    import ctypes  # pylint: disable=import-outside-toplevel
+
+    if os.uname().sysname == "Darwin":
+        try:
+            clonefile = ctypes.CDLL(None, use_errno=True).clonefile
+        except AttributeError:
+            return False
+        return clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), 0x40049409, fsrc.fileno())  # FICLONE
+        return True
+    except OSError:
+        return False
+
+
+def copy_file(src, dst):
+    """Copy src over dst atomically, keeping its mtime.
+
+    Clones the file where the filesystem can (APFS, btrfs, XFS), else uses
+    copy_file_range so the kernel moves the data, else a plain copy.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.sync-tmp")
+    try:
+        if not _clone(src, tmp):
+            with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+                copy_range = getattr(os, "copy_file_range", None)
+                copied = False
+                if copy_range is not None:
+                    try:
+                        while copy_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                            pass
+                        copied = True
+                    except OSError:
+                        fsrc.seek(0)
+                        fdst.seek(0)
+                        fdst.truncate()
+                if not copied:
+                    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except OSError:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+@dataclass
+class SyncAction:
+    """One step of a sync; paths are relative to both roots."""
+
+    kind: str  # "copy", "delete" or "conflict"
+    path: str
+    # copy: the side copied from; delete: the side deleted on
+    side: int = 0
+    size: int = 0
+    reason: str = ""
+
+
+class TreeSync:
+    """Per-file two-way sync of two trees against their last-synced state.
+
+    The state (~/.cache/dotfiles/btt-sync.json) holds each file's stat on
+    both sides as of the last sync. A file changed on one side only is
+    copied to the other, and one deleted on one side while unchanged on the
+    other is deleted there too. A file changed on both sides, or deleted on
+    one and changed on the other, is a conflict: it is reported and left
+    alone unless both sides now hold the same content. With no state yet
+    (the first sync), nothing is deleted and, where both sides differ, the
+    newer file wins.
+    """
+
+    VERSION = 1
+
+    def __init__(self, left: Manifest, right: Manifest, state_path, names=("left", "right")):
+        self.sides = (left, right)
+        self.names = names
+        self.state_path = Path(state_path)
+        # Relative path -> (left state, right state) at the last sync
+        self.base: Dict[str, Tuple[FileState, FileState]] = {}
+        self.first_sync = True
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data["version"] == self.VERSION and data["roots"] == [
+                str(side.root) for side in self.sides
+            ]:
+                self.base = {
+                    path: (FileState(*states[0]), FileState(*states[1]))
+                    for path, states in data["files"].items()
+                }
+                self.first_sync = False
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            pass
+
+    def _same_content(self, path, states) -> bool:
+        if states[0].size != states[1].size:
+            return False
+        if states[0].sha1 and states[1].sha1:
+            return states[0].sha1 == states[1].sha1
+        return _sha1(self.sides[0].root / path) == _sha1(self.sides[1].root / path)
+
+    def plan(self) -> List[SyncAction]:
+        """Compare both trees with the last sync; return what to do."""
+        files = [side.files for side in self.sides]
+        actions = []
+        for path in sorted(set(files[0]) | set(files[1]) | set(self.base)):
+            current = (files[0].get(path), files[1].get(path))
+            base = self.base.get(path)
+            # Whether each side was added, edited or deleted since the sync
+            changed = [
+                _changed(state, None if base is None else base[i])
+                for i, state in enumerate(current)
+            ]
+            if not any(changed) or current == (None, None):
+                continue
+            if changed[0] and changed[1]:
+                if None not in current and self._same_content(path, current):
+                    continue  # the same edit on both sides
+                if base is None and None not in current and self.first_sync:
+                    newer = 0 if current[0].mtime_ns >= current[1].mtime_ns else 1
+                    actions.append(SyncAction("copy", path, newer, current[newer].size))
+                    continue
+                if None in current:
+                    reason = f"deleted in {self.names[current.index(None)]}, changed in the other"
+                else:
+                    reason = "changed on both sides"
+                actions.append(SyncAction("conflict", path, reason=reason))
+                continue
+            side = 0 if changed[0] else 1
+            if current[side] is not None:
+                actions.append(SyncAction("copy", path, side, current[side].size))
+            elif current[1 - side] is not None:
+                actions.append(SyncAction("delete", path, 1 - side, current[1 - side].size))
+        return actions
+
+    def describe(self, action: SyncAction) -> str:
+        """One line for a planned action."""
+        if action.kind == "copy":
+            arrow = f"{self.names[action.side]} → {self.names[1 - action.side]}"
+            return f"  copy    {arrow:<16} {_format_bytes(action.size):>9}  {action.path}"
+        if action.kind == "delete":
+            where = f"in {self.names[action.side]}"
+            return f"  delete  {where:<16} {_format_bytes(action.size):>9}  {action.path}"
+        return f"  ✗ conflict ({action.reason}): {action.path}"
+
+    def apply(self, actions: List[SyncAction]) -> List[str]:
+        """Carry out the copies and deletes, then save the new synced state.
+
+        Returns errors; paths that failed are retried on the next sync.
+        """
+        errors = []
+        failed = {action.path for action in actions if action.kind == "conflict"}
+        for action in actions:
+            try:
+                if action.kind == "copy":
+                    copy_file(
+                        self.sides[action.side].root / action.path,
+                        self.sides[1 - action.side].root / action.path,
+                    )
+                elif action.kind == "delete":
+                    root = self.sides[action.side].root
+                    (root / action.path).unlink()
+                    _remove_empty_parents(root / action.path, root)
+            except OSError as e:
+                errors.append(f"{action.path}: {e}")
+                failed.add(action.path)
+
+        for side in self.sides:
+            side.scan()
+            side.save()
+        files = [side.files for side in self.sides]
+        base = {}
+        for path in set(files[0]) | set(files[1]) | set(self.base):
+            if path in failed:
+                if path in self.base:
+                    base[path] = self.base[path]
+            elif path in files[0] and path in files[1]:
+                base[path] = (files[0][path], files[1][path])
+        self.base = base
+        self.first_sync = False
+        self._save()
+        return errors
+
+    def _save(self):
+        data = {
+            "version": self.VERSION,
+            "roots": [str(side.root) for side in self.sides],
+            "files": {
+                path: [list(states[0]), list(states[1])] for path, states in self.base.items()
+            },
+        }
+        _write_json(self.state_path, data)
+
+
+def _changed(state: Optional[FileState], synced: Optional[FileState]) -> bool:
+    if state is None or synced is None:
+        return state is not synced
+    if state.sha1 and synced.sha1:
+        return state.sha1 != synced.sha1  # touched, or copied, but the same content
+    return state[:3] != synced[:3]
+
+
+def _remove_empty_parents(path, root):
+    """Remove directories left empty by a delete, up to (not including) root."""
+    parent = path.parent
+    while parent != root and root in parent.parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            return
+        parent = parent.parent
+
+
+# BetterTouchTool files written in place rather than replaced (see Manifest)
+BTT_IN_PLACE = ("btt_data_store*",)
+
+
+def sync_bettertouchtool(dry_run=False):
+    """Sync BetterTouchTool settings both ways, file by file."""
     hostname = os.uname().nodename
     if hostname != "icecream":
         return None
@@ -178,91 +954,314 @@ def sync_bettertouchtool():
     # Ensure repo directory parent exists
     repo_dir.parent.mkdir(parents=True, exist_ok=True)
 
-    # Get newest modification times
-    library_mtime = get_newest_mtime(library_dir)
-    repo_mtime = get_newest_mtime(repo_dir)
+    # Bring both manifests up to date, re-listing only directories that
+    # changed. BetterTouchTool rewrites its SQLite store (and its -wal and
+    # -shm files) in place, which leaves directory mtimes alone, so those
+    # are re-stat'ed every time; a missed edit would be overwritten by the
+    # other side's instead of reported
+    manifests = (
+        Manifest(
+            library_dir, CACHE_DIR / "btt-library.json", hash_files=True, restat=BTT_IN_PLACE
+        ),
+        Manifest(repo_dir, CACHE_DIR / "btt-repo.json", hash_files=True, restat=BTT_IN_PLACE),
+    )
+    for side, manifest in zip(("Library", "Repo"), manifests):
+        first_scan = not manifest.dirs
+        diff = manifest.scan()
+        if diff and not first_scan:
+            print(f"BetterTouchTool changes in {side} since the last run:")
+            for line in diff.lines():
+                print(f"  {line}")
+    sync = TreeSync(*manifests, CACHE_DIR / "btt-sync.json", names=("Library", "Repo"))
+    actions = sync.plan()
+    conflicts = [action for action in actions if action.kind == "conflict"]
 
-    # Determine sync direction
-    if library_mtime > repo_mtime:
-        source = library_dir
-        dest = repo_dir
-        direction = "Library → Repo"
-    else:
-        source = repo_dir
-        dest = library_dir
-        direction = "Repo → Library"
-
-    # If repo doesn't exist yet, always sync from Library
-    if not repo_dir.exists():
-        source = library_dir
-        dest = repo_dir
-        direction = "Library → Repo (initial)"
-
-    cmd = ["rsync", "-avh", "--delete", "--progress", f"{source}/", f"{dest}/"]
+    if not actions:
+        if not dry_run:
+            sync.apply(actions)  # record the synced state, even on the first run
+        print("✓ BetterTouchTool settings already in sync")
+        return True
+    heading = "Would sync" if dry_run else "Syncing"
+    moved = sum(action.size for action in actions if action.kind == "copy")
+    print(f"{heading} BetterTouchTool settings ({_format_bytes(moved)} to copy):")
+    for action in actions:
+        print(sync.describe(action))
+    if dry_run:
+        return True
 
-    try:
-        print(f"Syncing BetterTouchTool settings: {direction}")
-        result = subprocess.run(cmd, text=True, check=False)
-        if result.returncode == 0:
-            print(f"✓ BetterTouchTool settings synced: {direction}")
-            return True
+    errors = sync.apply(actions)
+    for error in errors:
+        print(f"✗ {error}")
+    if errors or conflicts:
         print(
-            f"✗ Failed to sync BetterTouchTool settings (exit code: {result.returncode})"
+            f"✗ BetterTouchTool sync left {len(conflicts)} conflicts and "
+            f"{len(errors)} errors; resolve them and run again"
         )
         return False
-    except FileNotFoundError:
-        print("✗ rsync command not found")
-        return False
-    except OSError as e:
-        print(f"✗ Error syncing BetterTouchTool: {e}")
-        return False
+    print("✓ BetterTouchTool settings synced")
+    return True
 
 
-def main():
-    """Main function to apply stow and handle conflicts."""
-    # Check if stow is available
-    if not check_stow_available():
-        print("✗ Error: stow command not found")
-        print("Please install GNU stow:")
-        print("  - macOS: brew install stow")
-        print("  - Ubuntu/Debian: sudo apt-get install stow")
-        print("  - Fedora: sudo dnf install stow")
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="list the conflicts stow would hit and the BetterTouchTool copies "
+        "and deletes (with sizes) without changing anything",
+    )
+    commands = parser.add_subparsers(dest="command")
+    restore = commands.add_parser(
+        "restore",
+        help="put files moved aside by earlier runs back (no paths and no --run: list runs)",
+    )
+    restore.add_argument("paths", nargs="*", help="paths relative to ~ (files or directories)")
+    restore.add_argument(
+        "--run", help="restore from this run (default: the latest holding each path)"
+    )
+    restore.add_argument(
+        "--force", action="store_true", help="overwrite regular files in the way"
+    )
+    gc = commands.add_parser("gc", help="drop old backup runs, then blobs no run uses")
+    gc.add_argument(
+        "--keep-runs",
+        type=int,
+        default=BackupStore.KEEP_RUNS,
+        help="always keep this many newest runs (default: %(default)s)",
+    )
+    gc.add_argument(
+        "--keep-days",
+        type=int,
+        default=BackupStore.KEEP_DAYS,
+        help="keep every run younger than this (default: %(default)s)",
+    )
+    return parser.parse_args(argv)
+
+
+def restore_backups(args):
+    """The restore command."""
+    store = BackupStore()
+    if not args.paths and not args.run:
+        runs = store.runs()
+        if not runs:
+            print("No backup runs in ~/dotfiles-backup")
+        for run in runs:
+            files = store.load_run(run)["files"]
+            print(f"{run.stem}  ({len(files)} files)")
+            for path in sorted(files):
+                print(f"  {path}")
+        return 0
+    try:
+        restored, skipped = store.restore(args.paths, args.run, force=args.force)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"✗ Restore failed: {e}")
         return 1
+    for path in restored:
+        print(f"✓ Restored {path}")
+    for path, reason in skipped:
+        print(f"✗ Skipped {path}: {reason}")
+    return 1 if skipped else 0
+
+
+def collect_garbage(args):
+    """The gc command."""
+    runs, blobs, freed = BackupStore().gc(args.keep_runs, args.keep_days)
+    print(f"Removed {len(runs)} runs and {blobs} unused blobs ({_format_bytes(freed)})")
+    return 0
+
+
+def stow_dotfiles():
+    """Move every conflict aside in one batch, then stow once."""
+    # Every conflict is known before anything moves, so one stow suffices
+    plan = plan_stow()
+    all_moved = move_conflicts(plan.conflicts)
+    for target_rel in plan.foreign:
+        print(f"✗ {target_rel} is a symlink to outside the dotfiles; leaving it")
 
-    all_moved = []
-    while True:
-        output = run_stow()
-        if output is None:
+    if check_stow_available():
+        result = run_stow()
+        if result is None:
             print("✗ Error: Failed to run stow command")
-            return 1
-        conflicts = parse_conflicts(output)
-        if not conflicts:
-            break
-        moved = move_conflicts(conflicts)
-        all_moved.extend(moved)
+            return False
+        if result.returncode != 0:
+            print(result.stdout)
+            print(f"✗ stow failed (exit code: {result.returncode})")
+            return False
+    else:
+        # Without stow (e.g. a cron job on a fresh machine), make the links
+        # the plan calls for; stale links from removed files aren't pruned
+        print("stow command not found; linking natively")
+        print("For --restow cleanup, install GNU stow:")
+        print("  - macOS: brew install stow")
+        print("  - Ubuntu/Debian: sudo apt-get install stow")
+        print("  - Fedora: sudo dnf install stow")
+        # Re-plan, since the conflicts moved aside are now free targets
+        linked = link_natively(plan_stow())
+        print(f"✓ Linked {len(linked)} paths")
 
     if all_moved:
-        print("Moved the following conflicting files to ~/dotfiles-backup:\n")
+        print(
+            "Moved the following conflicting files to ~/dotfiles-backup "
+            "(`apply_stow.py restore` puts them back):\n"
+        )
         for f in all_moved:
             print(f"  {f}")
     else:
         print("No conflicts found. Stow completed cleanly.")
+    return True
 
-    # Configure iTerm2 custom preferences folder (macOS only)
-    configure_iterm2()
 
-    # Sync BetterTouchTool settings if on icecream
-    sync_bettertouchtool()
-
-    # Cursor skills + workspace rules (see dotfiles/cursor/README.md)
+def link_cursor_rules():
+    """Cursor skills + workspace rules (see dotfiles/cursor/README.md)."""
     link_script = DOTFILES / "scripts" / "link_cursor_rules.sh"
-    if link_script.is_file():
-        subprocess.run(["bash", str(link_script)], check=False)
+    if not link_script.is_file():
+        return None
+    result = subprocess.run(
+        ["bash", str(link_script)],
+        text=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        check=False,
+    )
+    print(result.stdout, end="")
+    return result.returncode == 0
 
-    return 0
 
+@dataclass
+class Step:
+    """One unit of an apply, run once the steps named in `after` succeed."""
+
+    name: str
+    run: Callable[[], object]
+    after: Tuple[str, ...] = ()
+    # ok, failed, error, skipped (nothing to do here), or blocked (a
+    # step it needs failed)
+    status: str = "pending"
+    seconds: float = 0.0
+    output: str = ""
 
-if __name__ == "__main__":
-    import sys
 
+class _StepOutput(io.TextIOBase):
+    """Stands in for sys.stdout so each step's prints stay together.
+
+    A step thread writes to its own buffer, printed whole when the step
+    ends; other threads write straight through.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def _run_step(step, output):
+    output.local.buffer = io.StringIO()
+    started = time.perf_counter()
+    try:
+        result = step.run()
+        if result is None:
+            step.status = "skipped"
+        elif result is True or (type(result) is int and result == 0):
+            step.status = "ok"  # True, or an exit status of 0; not False or 1
+        else:
+            step.status = "failed"
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        print(f"✗ {type(e).__name__}: {e}")
+        step.status = "error"
+    finally:
+        step.seconds = time.perf_counter() - started
+        step.output = output.local.buffer.getvalue()
+        output.local.buffer = None
+    return step
+
+
+def run_steps(steps, workers=None):
+    """Run steps concurrently as their dependencies allow; return them.
+
+    A step starts as soon as every step in its `after` is ok or skipped,
+    and is blocked if one failed. Each step's output is printed in one
+    piece when it finishes.
+    """
+    by_name = {step.name: step for step in steps}
+    pending = list(steps)
+    running = {}
+    output = _StepOutput(sys.stdout)
+    sys.stdout, stdout = output, sys.stdout
+    try:
+        with ThreadPoolExecutor(max_workers=workers or len(steps)) as pool:
+            while pending or running:
+                for step in list(pending):
+                    needs = [by_name[name].status for name in step.after]
+                    if any(status in ("failed", "error", "blocked") for status in needs):
+                        step.status = "blocked"
+                    elif all(status in ("ok", "skipped") for status in needs):
+                        running[pool.submit(_run_step, step, output)] = step
+                    else:
+                        continue
+                    pending.remove(step)
+                if not running:
+                    break  # the rest wait on each other
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    if step.output:
+                        stdout.write(step.output)
+                        stdout.flush()
+    finally:
+        sys.stdout = stdout
+    for step in pending:
+        step.status = "blocked"
+    return steps
+
+
+def print_summary(steps, seconds):
+    """Per-step wall time and status, and the whole run's."""
+    print(f"\n{'Step':<16} {'Status':<8} {'Time':>8}")
+    for step in steps:
+        print(f"{step.name:<16} {step.status:<8} {step.seconds:7.2f}s")
+    print(f"{'total':<16} {'':<8} {seconds:7.2f}s")
+
+
+def main(argv=None):
+    """Main function to apply stow and handle conflicts."""
+    args = parse_args(argv)
+    if args.command == "restore":
+        return restore_backups(args)
+    if args.command == "gc":
+        return collect_garbage(args)
+    if args.dry_run:
+        plan = plan_stow()
+        for target_rel in plan.conflicts:
+            print(f"Would move to ~/dotfiles-backup: {target_rel}")
+        for target_rel in plan.foreign:
+            print(f"✗ {target_rel} is a symlink to outside the dotfiles; leaving it")
+        print(f"Would stow {len(plan.links)} new links")
+        sync_bettertouchtool(dry_run=True)
+        return 0
+
+    # stow ignores BetterTouchTool and never touches the iTerm2 plist, so
+    # those overlap with it; the Cursor links go inside the stowed ~/.cursor
+    steps = [
+        Step("stow", stow_dotfiles),
+        # Configure iTerm2 custom preferences folder (macOS only)
+        Step("iterm2", configure_iterm2),
+        # Sync BetterTouchTool settings if on icecream
+        Step("bettertouchtool", sync_bettertouchtool),
+        Step("cursor", link_cursor_rules, after=("stow",)),
+    ]
+    started = time.perf_counter()
+    run_steps(steps)
+    print_summary(steps, time.perf_counter() - started)
+    return 0 if all(step.status in ("ok", "skipped") for step in steps) else 1
+
+
+if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Benchmark launcher.py's parser, command index and search on synthetic configs.
+
+    python3 scripts/bench_launcher.py run [--sizes 100,1000,10000,100000] [-o OUT]
+    python3 scripts/bench_launcher.py compare BASE.json NEW.json [--threshold 0.25]
+
+`run` writes a zsh config of each size (functions and aliases with
+comments, nested blocks, quoting and heredocs, half of them in a sourced
+file) to a temporary directory and measures, per size:
+
+- scan_ms: the lexer alone over every file, and its MB/s; `run` fails
+  if that is below launcher.LEXER_TARGET_MBPS on a config of 1 MB or more
+- parse_cold_ms: ZshParser.parse() with no index, including the write
+- cache_cold_ms: a new ZshParser loading the index written by that parse
+- cache_warm_ms: parse() again on the same parser (only stats the files)
+- index_build_ms: building the SearchIndex
+- keystroke_p50_ms/p95_ms/max_ms: SearchIndex.rank for every prefix of
+  the recorded query sequences in QUERY_SEQUENCES, as typed in the UI
+- render_p50_ms/max_ms: rebuilding and drawing the visible rows of the
+  headless UI's list for those results (skipped without textual)
+
+Timings are the best of --repeat runs (keystrokes: the median and tail
+over all of them). `compare` fails if any timing in NEW is more than
+--threshold slower than in BASE, ignoring differences under --min-ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+import launcher  # pylint: disable=wrong-import-position
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+DEFAULT_OUTPUT = Path.home() / ".cache" / "launcher_bench.json"
+# Smaller configs scan too quickly to time the lexer's throughput reliably
+SCAN_TARGET_MIN_BYTES = 1_000_000
+
+WORDS = (
+    "git docker backup sync remind notes diary cloud music server deploy "
+    "status log pull push branch stash commit clean update build test watch "
+    "photo video mount drive share tunnel proxy vpn ssh key secret token "
+    "weather calendar journal todo list show edit open close start stop"
+).split()
+
+# Queries as typed: each one is ranked after every keystroke, including
+# the backspaces that undo a miss ("-" removes the last character)
+QUERY_SEQUENCES = (
+    "git",
+    "git-st",
+    "docker",
+    "rem---note",
+    "backup sync",
+    "show the",
+    "sts",
+    "zzqx----wa",
+    "c",
+)
+
+
+def _function(rng: random.Random, name: str) -> str:
+    word = rng.choice(WORDS)
+    body = [f'    local target="${{1:-$HOME/{word}}}"']
+    shape = rng.randrange(4)
+    if shape == 0:
+        body += [
+            '    if [[ -d "$target" ]]; then',
+            f"        cd \"$target\" && ls -la | grep '}}' | head -n {rng.randrange(1, 20)}",
+            "    else",
+            f'        echo "no {{ {word} }} in $target" >&2',
+            "        return 1",
+            "    fi",
+        ]
+    elif shape == 1:
+        body += [
+            '    case "$2" in',
+            f'        {word}) echo "$(date +%s) ${{target##*/}}" ;;',
+            "        *) printf '%s\\n' \"$@\" ;;",
+            "    esac",
+        ]
+    elif shape == 2:
+        body += [
+            "    cat <<EOF",
+            f"{word} report for ${{target}} }} {{ \"unbalanced' quotes",
+            "EOF",
+        ]
+    else:
+        body += [
+            "    local item",
+            "    for item in $target/*(N); do",
+            f'        [[ "$item" == *{word}* ]] && {{ echo "$item"; }}',
+            "    done",
+        ]
+    return f"{name}() {{\n" + "\n".join(body) + "\n}"
+
+
+def _alias(rng: random.Random, name: str) -> str:
+    word = rng.choice(WORDS)
+    if rng.random() < 0.5:
+        return f"alias {name}='{word} --{rng.choice(WORDS)} \"$HOME/{word}\"'"
+    return f'alias {name}="cd ~/{word} && {rng.choice(WORDS)} \\"$(pwd)\\""'
+
+
+def write_config(directory: Path, size: int, seed: int = 0) -> Path:
+    """Write a config of size definitions; return the file to parse."""
+    rng = random.Random(seed)
+    files = [[], []]
+    for i in range(size):
+        words = rng.sample(WORDS, 2)
+        name = f"{words[0]}-{words[1]}{i}" if i % 3 else f"{words[0]}_{i}"
+        description = " ".join(rng.sample(WORDS, rng.randrange(2, 6)))
+        if i % 2:
+            definition = f"# {description}\n{_function(rng, name)}"
+        elif i % 7 == 0:
+            definition = f"{_alias(rng, name)} # launcher-hidden"
+        else:
+            definition = f"{_alias(rng, name)} # {description}"
+        files[i % 2].append(definition)
+
+    main = directory / "common.zsh"
+    extra = directory / "extra.zsh"
+    extra.write_text("\n\n".join(files[1]) + "\n", encoding="utf-8")
+    main.write_text(
+        "\n\n".join(files[0]) + f"\n\nsource {extra}\n", encoding="utf-8"
+    )
+    return main
+
+
+def _best(repeat: int, run) -> float:
+    """Best wall time of run() over repeat calls, in ms."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times)
+
+
+def keystrokes():
+    """Every query as the UI ranks it, one per keystroke."""
+    for sequence in QUERY_SEQUENCES:
+        typed = ""
+        for char in sequence:
+            typed = typed[:-1] if char == "-" and typed else typed + char
+            yield typed
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_render(commands, index, repeat: int):
+    """Per-keystroke list rebuild and draw in the headless UI, in ms."""
+    try:
+        import launcher_tui  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+
+    times = []
+
+    async def run():
+        app = launcher_tui.LauncherApp(
+            commands, "bench.zsh", index.rank, launcher.profiler
+        )
+        async with app.run_test(size=(100, 30)) as pilot:
+            await pilot.pause()
+            command_list = app.query_one("#command_list", launcher_tui.CommandList)
+            for _ in range(repeat):
+                for query in keystrokes():
+                    app.matches = index.rank(query)
+                    started = time.perf_counter()
+                    app._populate_list()  # pylint: disable=protected-access
+                    for y in range(command_list.size.height):
+                        command_list.render_line(y)
+                    times.append((time.perf_counter() - started) * 1000)
+                    await pilot.pause()
+
+    asyncio.run(run())
+    return times
+
+
+def bench_size(size: int, repeat: int, render: bool) -> dict:
+    """Measure one config size."""
+    with tempfile.TemporaryDirectory(prefix="launcher-bench-") as tmp:
+        directory = Path(tmp)
+        zsh_file = write_config(directory, size)
+        sources = [path.read_bytes() for path in sorted(directory.glob("*.zsh"))]
+        total_bytes = sum(len(data) for data in sources)
+        cache_file = directory / "index.bin"
+
+        def parser():
+            result = launcher.ZshParser(str(zsh_file), dotfiles_opts=[])
+            result.cache_file = cache_file
+            return result
+
+        def parse_cold():
+            cache_file.unlink(missing_ok=True)
+            parser().parse()
+
+        scan_ms = _best(repeat, lambda: [launcher.scan_zsh(data) for data in sources])
+        parse_cold_ms = _best(repeat, parse_cold)
+        cache_cold_ms = _best(repeat, lambda: parser().parse())
+        warm = parser()
+        commands = warm.parse()
+        cache_warm_ms = _best(repeat, warm.parse)
+        index_build_ms = _best(repeat, lambda: launcher.SearchIndex(commands))
+
+        index = launcher.SearchIndex(commands)
+        keystroke_ms = []
+        for _ in range(repeat):
+            for query in keystrokes():
+                started = time.perf_counter()
+                index.rank(query)
+                keystroke_ms.append((time.perf_counter() - started) * 1000)
+            index = launcher.SearchIndex(commands)  # start each pass uncached
+
+        result = {
+            "commands": len(commands),
+            "bytes": total_bytes,
+            "scan_ms": scan_ms,
+            "scan_mbps": total_bytes / 1e6 / (scan_ms / 1000),
+            "parse_cold_ms": parse_cold_ms,
+            "cache_cold_ms": cache_cold_ms,
+            "cache_warm_ms": cache_warm_ms,
+            "index_build_ms": index_build_ms,
+            "keystroke_p50_ms": statistics.median(keystroke_ms),
+            "keystroke_p95_ms": _percentile(keystroke_ms, 0.95),
+            "keystroke_max_ms": max(keystroke_ms),
+        }
+        render_ms = bench_render(commands, index, repeat) if render else None
+        if render_ms:
+            result["render_p50_ms"] = statistics.median(render_ms)
+            result["render_max_ms"] = max(render_ms)
+        return result
+
+
+def run(args) -> int:
+    """Benchmark every size and save the results."""
+    results = {}
+    failures = []
+    for size in args.sizes:
+        result = bench_size(size, args.repeat, args.render)
+        results[str(size)] = result
+        if (
+            result["bytes"] >= SCAN_TARGET_MIN_BYTES
+            and result["scan_mbps"] < launcher.LEXER_TARGET_MBPS
+        ):
+            failures.append(
+                f"scan at {size} items: {result['scan_mbps']:.1f} MB/s, "
+                f"below the {launcher.LEXER_TARGET_MBPS:g} MB/s target"
+            )
+        render = (
+            f"  render p50 {result['render_p50_ms']:6.2f} ms" if "render_p50_ms" in result else ""
+        )
+        print(
+            f"{size:>7} items  scan {result['scan_mbps']:5.1f} MB/s  "
+            f"parse {result['parse_cold_ms']:9.1f} ms  "
+            f"cache cold {result['cache_cold_ms']:8.1f} ms "
+            f"warm {result['cache_warm_ms']:6.2f} ms  keystroke p95 "
+            f"{result['keystroke_p95_ms']:7.2f} ms{render}"
+        )
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Saved {args.output}")
+    for failure in failures:
+        print(f"✗ {failure}")
+    return 1 if failures else 0
+
+
+def compare(args) -> int:
+    """Fail if any timing in args.new regressed past the threshold."""
+    base = json.loads(args.base.read_text(encoding="utf-8"))["results"]
+    new = json.loads(args.new.read_text(encoding="utf-8"))["results"]
+    failures = []
+    for size, result in new.items():
+        for metric, value in result.items():
+            before = base.get(size, {}).get(metric)
+            if not metric.endswith("_ms") or before is None:
+                continue
+            change = (value - before) / before if before else 0.0
+            regressed = change > args.threshold and value - before >= args.min_ms
+            status = "OVER" if regressed else "ok"
+            print(
+                f"{size:>7} {metric:<18} {before:10.2f} -> {value:10.2f} ms "
+                f"({change:+7.1%})  {status}"
+            )
+            if regressed:
+                failures.append(f"{metric} at {size} items: {change:+.1%}")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    if not failures:
+        print(f"✓ No timing regressed more than {args.threshold:.0%}")
+    return 1 if failures else 0
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="mode", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and save JSON")
+    run_parser.add_argument(
+        "--sizes",
+        type=lambda text: [int(size) for size in text.split(",")],
+        default=list(DEFAULT_SIZES),
+        help="comma-separated config sizes (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per timing (default: 3)"
+    )
+    run_parser.add_argument(
+        "--no-render",
+        dest="render",
+        action="store_false",
+        help="skip the headless UI render timings",
+    )
+    run_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=DEFAULT_OUTPUT,
+        help=f"where to save the results (default: {DEFAULT_OUTPUT})",
+    )
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare two saved runs; fail on a regression"
+    )
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("new", type=Path)
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("LAUNCHER_BENCH_THRESHOLD", 0.25)),
+        help="allowed slowdown as a fraction (default: 0.25, "
+        "or LAUNCHER_BENCH_THRESHOLD)",
+    )
+    compare_parser.add_argument(
+        "--min-ms",
+        type=float,
+        default=0.5,
+        help="ignore slowdowns smaller than this many ms (default: 0.5)",
+    )
+    compare_parser.set_defaults(func=compare)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    sys.exit(arguments.func(arguments))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Check launcher.py's startup imports against the time-to-first-paint budget.
+
+Runs `python -X importtime` on the launcher's two startup stages and fails
+if either goes over budget, or if the headless stage pulls in a module that
+should only load on demand (textual, rich, fuzzywuzzy).
+"""
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+
+# Cumulative import time budgets, in milliseconds. See "Startup budget" in
+# README.md; together with parsing (warm index: a few ms) they add up to the
+# 500 ms time-to-first-paint budget.
+BUDGETS_MS = {
+    "launcher": 100,  # everything up to parsing and headless queries
+    "launcher_tui": 400,  # textual and the UI, only when the UI is shown
+}
+LAZY_MODULES = ("textual", "rich", "fuzzywuzzy")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)$")
+
+
+def import_times(statement):
+    """Run a statement under -X importtime; return {module: cumulative ms}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO,
+        text=True,
+        capture_output=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match.group(2)] = int(match.group(1)) / 1000
+    return modules
+
+
+def main():
+    """Measure each stage (best of several runs) and compare with the budget."""
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failures = []
+
+    best = {name: None for name in BUDGETS_MS}
+    for _ in range(runs):
+        modules = import_times("import launcher, launcher_tui")
+        for name in BUDGETS_MS:
+            cumulative = modules[name]
+            if best[name] is None or cumulative < best[name]:
+                best[name] = cumulative
+
+    headless = import_times("import launcher")
+    eager = sorted(
+        name for name in headless if name.split(".")[0] in LAZY_MODULES
+    )
+    if eager:
+        failures.append(f"`import launcher` loads {', '.join(eager[:5])}")
+
+    for name, budget in BUDGETS_MS.items():
+        status = "ok" if best[name] <= budget else "OVER"
+        print(f"{name:<14} {best[name]:8.1f} ms  (budget {budget} ms)  {status}")
+        if best[name] > budget:
+            failures.append(f"{name} took {best[name]:.1f} ms, budget {budget} ms")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    if not failures:
+        print("✓ Startup imports are within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())